@@ -0,0 +1,282 @@
+"""
+AI任务创建作业队列
+/api/ai/create 的异步模式：请求只负责入队并立即返回作业ID，
+后台工作池按小批量解析文本并插入任务，作业状态持久化在 SQLite 的 ai_jobs 表中
+
+领取作业时写入租约（持有者 + 过期时间），处理期间定期续约；
+只有租约过期的 running 作业才会被重新领取，多进程（uvicorn --workers N）或滚动重启时
+不会接手其他存活进程正在处理的作业，写入结果时也只处理仍由自己持有的作业
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from database import get_db_connection, create_tasks
+
+# 工作协程数量
+WORKER_COUNT = int(os.getenv("AI_JOB_WORKERS", "2"))
+
+# 每个工作协程一次领取的作业数（小批量插入）
+BATCH_SIZE = int(os.getenv("AI_JOB_BATCH_SIZE", "16"))
+
+# 排队作业上限，超过后拒绝入队（背压）
+MAX_PENDING = int(os.getenv("AI_JOB_MAX_PENDING", "1000"))
+
+# 无作业时的轮询间隔（秒），入队会立即唤醒工作协程
+POLL_INTERVAL = 1.0
+
+# 作业租约时长（秒）：进程崩溃后，其未完成的作业在租约过期后由其他工作协程接手
+LEASE_SECONDS = int(os.getenv("AI_JOB_LEASE_SECONDS", "120"))
+
+# 已完成/失败作业的保留天数，由定期维护任务清理
+JOB_RETENTION_DAYS = int(os.getenv("AI_JOB_RETENTION_DAYS", "7"))
+
+# 工作协程出错后的退避时间（秒），连续出错时翻倍，最长 MAX_ERROR_BACKOFF
+ERROR_BACKOFF = 0.5
+MAX_ERROR_BACKOFF = 30.0
+
+
+class QueueFullError(Exception):
+    """排队作业数已达上限"""
+
+
+def enqueue_job(text: str) -> Dict[str, Any]:
+    """新建一个排队作业"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT COUNT(*) as pending FROM ai_jobs WHERE status IN ('queued', 'running')")
+    if cursor.fetchone()['pending'] >= MAX_PENDING:
+        conn.close()
+        raise QueueFullError(f"排队作业已达上限 {MAX_PENDING}")
+
+    cursor.execute("INSERT INTO ai_jobs (text) VALUES (?) RETURNING *", (text,))
+    job = dict(cursor.fetchone())
+    conn.commit()
+    conn.close()
+    return job
+
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    """根据ID获取作业"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM ai_jobs WHERE id = ?", (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def claim_jobs(limit: int, owner: str) -> List[Dict[str, Any]]:
+    """
+    原子地领取最多 limit 个作业并标记为 running，租约归 owner 所有
+    可领取：排队中的作业，以及租约已过期（持有进程已退出）的 running 作业
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE ai_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP,
+            lease_owner = ?, lease_expires_at = datetime('now', ?)
+        WHERE id IN (
+            SELECT id FROM ai_jobs
+            WHERE status = 'queued'
+               OR (status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < datetime('now')))
+            ORDER BY id LIMIT ?
+        )
+        RETURNING *
+    ''', (owner, f"+{LEASE_SECONDS} seconds", limit))
+    jobs = sorted((dict(row) for row in cursor.fetchall()), key=lambda job: job['id'])
+    conn.commit()
+    conn.close()
+    return jobs
+
+
+def renew_leases(job_ids: List[int], owner: str) -> int:
+    """延长 owner 仍持有的作业租约，返回续约数量"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" * len(job_ids))
+    cursor.execute(
+        f"UPDATE ai_jobs SET lease_expires_at = datetime('now', ?) "
+        f"WHERE status = 'running' AND lease_owner = ? AND id IN ({placeholders})",
+        [f"+{LEASE_SECONDS} seconds", owner, *job_ids]
+    )
+    count = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+
+def release_jobs(owner: str, job_ids: Optional[List[int]] = None) -> int:
+    """
+    把 owner 持有的 running 作业放回队列，返回数量
+    job_ids 为空时释放该持有者的全部作业（进程正常退出时），否则只释放指定作业（结果没能写入时）
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    sql = (
+        "UPDATE ai_jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP, "
+        "lease_owner = NULL, lease_expires_at = NULL "
+        "WHERE status = 'running' AND lease_owner = ?"
+    )
+    params: List[Any] = [owner]
+    if job_ids is not None:
+        sql += f" AND id IN ({', '.join('?' * len(job_ids))})"
+        params.extend(job_ids)
+    cursor.execute(sql, params)
+    count = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+
+def finish_jobs(jobs: List[Dict[str, Any]], outcomes: List[Any], owner: str):
+    """
+    记录一批作业的结果（单个事务）
+    outcomes 与 jobs 一一对应：成功为解析后的任务数据，失败为异常
+    租约已过期并被其他工作协程接手的作业直接跳过，避免重复创建任务
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    placeholders = ", ".join("?" * len(jobs))
+    cursor.execute(
+        f"SELECT id FROM ai_jobs WHERE status = 'running' AND lease_owner = ? AND id IN ({placeholders})",
+        [owner, *(job['id'] for job in jobs)]
+    )
+    owned = {row['id'] for row in cursor.fetchall()}
+    if len(owned) < len(jobs):
+        print(f"⚠️ {len(jobs) - len(owned)} 个AI作业的租约已被接手，跳过写入结果")
+
+    results = [(job, outcome) for job, outcome in zip(jobs, outcomes) if job['id'] in owned]
+    succeeded = [(job, data) for job, data in results if not isinstance(data, BaseException)]
+    failed = [(job, error) for job, error in results if isinstance(error, BaseException)]
+
+    created = create_tasks([data for _, data in succeeded], conn=conn)
+    cursor.executemany(
+        "UPDATE ai_jobs SET status = 'done', task_id = ?, updated_at = CURRENT_TIMESTAMP, "
+        "lease_owner = NULL, lease_expires_at = NULL WHERE id = ?",
+        [(task['id'], job['id']) for (job, _), task in zip(succeeded, created)]
+    )
+    cursor.executemany(
+        "UPDATE ai_jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP, "
+        "lease_owner = NULL, lease_expires_at = NULL WHERE id = ?",
+        [(str(error), job['id']) for job, error in failed]
+    )
+
+    conn.commit()
+    conn.close()
+
+
+def prune_finished_jobs(older_than_days: int = JOB_RETENTION_DAYS) -> int:
+    """删除超过保留期的已完成/失败作业，返回删除数量"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "DELETE FROM ai_jobs WHERE status IN ('done', 'failed') AND updated_at < datetime('now', ?)",
+        (f"-{older_than_days} days",)
+    )
+    count = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+
+class AIJobWorkerPool:
+    """有界工作池：领取作业 → 并发解析 → 批量插入"""
+
+    def __init__(self, parser_factory: Callable[[], Any],
+                 workers: int = WORKER_COUNT, batch_size: int = BATCH_SIZE):
+        self.parser_factory = parser_factory
+        self.workers = workers
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        # 租约持有者标识：每个工作池（进程）唯一
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def start(self):
+        """启动工作协程（崩溃进程遗留的作业在租约过期后自动被领取）"""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._wakeup.set()
+
+    async def stop(self):
+        """停止工作协程，并把本进程正在处理的作业放回队列"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        released = release_jobs(self.owner)
+        if released:
+            print(f"♻️ 放回队列的AI作业: {released} 个")
+
+    def notify(self):
+        """有新作业入队时唤醒空闲的工作协程"""
+        self._wakeup.set()
+
+    async def _worker(self):
+        # 任何一轮出错（如数据库被归档/恢复锁住）都只记录并退避，工作协程不能退出，
+        # 否则入队接口仍返回 202 而作业永远停在 queued
+        failures = 0
+        stranded: List[Dict[str, Any]] = []  # 已领取但没能记录结果的作业
+        while True:
+            try:
+                if stranded:
+                    release_jobs(self.owner, [job['id'] for job in stranded])
+                    stranded.clear()
+                await self._run_once(stranded)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                print(f"❌ AI作业工作协程出错（第 {failures} 次），稍后重试: {e}")
+                await asyncio.sleep(min(ERROR_BACKOFF * 2 ** (failures - 1), MAX_ERROR_BACKOFF))
+
+    async def _run_once(self, claimed: List[Dict[str, Any]]):
+        """领取并处理一批作业；没有作业时等待唤醒或轮询超时。处理完成前作业留在 claimed 中"""
+        self._wakeup.clear()
+        jobs = claim_jobs(self.batch_size, self.owner)
+        if not jobs:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        claimed.extend(jobs)
+        heartbeat = asyncio.create_task(self._renew(jobs))
+        try:
+            await self._process(jobs)
+        except Exception as e:
+            print(f"❌ AI作业处理失败: {e}")
+            finish_jobs(jobs, [e] * len(jobs), self.owner)
+        finally:
+            heartbeat.cancel()
+        claimed.clear()
+
+    async def _renew(self, jobs: List[Dict[str, Any]]):
+        """处理期间每隔租约时长的三分之一续约一次（续约失败只记录，租约到期前还有两次机会）"""
+        job_ids = [job['id'] for job in jobs]
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                await asyncio.to_thread(renew_leases, job_ids, self.owner)
+            except Exception as e:
+                print(f"❌ AI作业续约失败: {e}")
+
+    async def _process(self, jobs: List[Dict[str, Any]]):
+        parser = self.parser_factory()
+
+        def parse(text: str) -> Dict[str, Any]:
+            return parser.validate_task_data(parser.parse(text))
+
+        # 解析可能是耗时的模型调用，放到线程中并发执行，不阻塞事件循环
+        outcomes = await asyncio.gather(
+            *[asyncio.to_thread(parse, job['text']) for job in jobs],
+            return_exceptions=True
+        )
+        finish_jobs(jobs, outcomes, self.owner)
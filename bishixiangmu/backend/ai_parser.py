@@ -5,17 +5,23 @@ AI自然语言解析器
 """
 
 import os
-import re
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
-from dotenv import load_dotenv
 
-load_dotenv()
+from rule_engine import CompiledRules, RuleEngine
+
 
 class AITaskParser:
     """AI任务解析器类"""
 
-    def __init__(self):
+    def __init__(self, rule_engine: Optional[RuleEngine] = None):
+        # 延迟加载 .env：仅在构造解析器时读取，不拖慢模块导入
+        from dotenv import load_dotenv
+        load_dotenv()
+
+        # 关键词规则（rules/default.json，修改后自动热重载）
+        self.rules = rule_engine or RuleEngine()
+
         self.api_key = os.getenv("DEEPSEEK_API_KEY") or os.getenv("OPENAI_API_KEY")
         self.use_real_api = bool(self.api_key)
 
@@ -33,6 +39,9 @@ class AITaskParser:
 
     def _parse_with_rules(self, text: str) -> Dict[str, Any]:
         """使用规则解析（模拟模式）"""
+        # 整个解析使用同一版规则，解析期间规则被替换也不受影响
+        rules = self.rules.current
+
         # 提取标题（取前40个字符）
         title = text[:40].strip()
         if len(text) > 40:
@@ -48,25 +57,12 @@ class AITaskParser:
         }
 
         # 解析日期关键词
-        date_keywords = {
-            "今天": 0,
-            "明天": 1,
-            "后天": 2,
-            "大后天": 3,
-            "下周": 7,
-            "下下周": 14,
-            "下个月": 30
-        }
-
-        today = datetime.now().date()
-        for keyword, days in date_keywords.items():
-            if keyword in text:
-                result["due_date"] = (today + timedelta(days=days)).isoformat()
-                break
+        days = rules.due_dates.first(text)
+        if days is not None:
+            result["due_date"] = (datetime.now().date() + timedelta(days=days)).isoformat()
 
         # 解析时间点
-        time_pattern = r'(\d{1,2})[:点](\d{0,2})?'
-        time_match = re.search(time_pattern, text)
+        time_match = rules.time_pattern.search(text)
         if time_match:
             hour = int(time_match.group(1))
             minute = int(time_match.group(2) or 0)
@@ -74,27 +70,13 @@ class AITaskParser:
             result["description"] += f"（时间: {hour:02d}:{minute:02d}）"
 
         # 解析优先级关键词
-        priority_map = {
-            "紧急": 1, "立刻": 1, "马上": 1, "尽快": 1, "高优先级": 1,
-            "重要": 2, "优先": 2,
-            "普通": 3, "一般": 3, "正常": 3,
-            "不急": 4, "有空": 4, "低优先级": 4,
-            "随便": 5, "任意": 5, "无限制": 5
-        }
-
-        for keyword, priority in priority_map.items():
-            if keyword in text:
-                result["priority"] = priority
-                break
+        result["priority"] = rules.priorities.first(text, result["priority"])
 
         # 解析状态关键词
-        if "完成" in text or "做了" in text or "搞定" in text:
-            result["status"] = "completed"
-        elif "进行" in text or "正在" in text or "处理中" in text:
-            result["status"] = "in_progress"
+        result["status"] = rules.statuses.first(text, result["status"])
 
         # 使用AI推荐优先级
-        result["priority"] = self.recommend_priority(result)
+        result["priority"] = self.recommend_priority(result, rules)
 
         return result
 
@@ -127,7 +109,7 @@ class AITaskParser:
 
         return base_result
 
-    def recommend_priority(self, task_data: Dict[str, Any]) -> int:
+    def recommend_priority(self, task_data: Dict[str, Any], rules: Optional[CompiledRules] = None) -> int:
         """
         基于规则/AI推荐优先级（1-5，1最高）
 
@@ -137,6 +119,7 @@ class AITaskParser:
         3. 根据内容关键词
         4. 综合计算
         """
+        rules = rules or self.rules.current
         priority_score = 3  # 默认优先级
 
         # 1. 根据截止日期紧迫性
@@ -175,30 +158,17 @@ class AITaskParser:
         full_text = f"{title} {description}"
 
         # 紧急关键词权重最高
-        urgent_keywords = ["紧急", "立刻", "马上", "尽快", "必须", "今天", "立即", "重要会议", "deadline", "截止"]
-        important_keywords = ["重要", "优先", "关键", "主要", "核心", "会议", "演示", "汇报"]
-        low_priority_keywords = ["有空", "不急", "以后", "改天", "空闲", "随意", "随便"]
-
-        # 检查紧急关键词
-        urgent_found = False
-        for keyword in urgent_keywords:
-            if keyword in full_text:
-                priority_score = 1
-                urgent_found = True
-                break
+        urgent_found = rules.urgent.any(full_text)
+        if urgent_found:
+            priority_score = 1
 
         # 如果未找到紧急关键词，检查重要关键词
-        if not urgent_found and priority_score > 2:
-            for keyword in important_keywords:
-                if keyword in full_text:
-                    priority_score = min(2, priority_score)
-                    break
+        if not urgent_found and priority_score > 2 and rules.important.any(full_text):
+            priority_score = min(2, priority_score)
 
         # 检查低优先级关键词
-        for keyword in low_priority_keywords:
-            if keyword in full_text and priority_score > 3:
-                priority_score = min(5, priority_score + 1)  # 降低优先级
-                break
+        if priority_score > 3 and rules.low_priority.any(full_text):
+            priority_score = min(5, priority_score + 1)  # 降低优先级
 
         # 4. 确保优先级在有效范围内
         return max(1, min(5, priority_score))
@@ -225,11 +195,12 @@ class AITaskParser:
         full_text = f"{text} {task_data.get('title', '')} {task_data.get('description', '')}"
         full_text = full_text.lower()
 
-        if any(word in full_text for word in ["紧急", "立刻", "马上", "尽快"]):
+        rules = self.rules.current
+        if rules.reason_urgent.any(full_text):
             reasons.append("检测到紧急关键词")
-        elif any(word in full_text for word in ["重要", "优先", "关键"]):
+        elif rules.reason_important.any(full_text):
             reasons.append("检测到重要关键词")
-        elif any(word in full_text for word in ["有空", "不急", "以后"]):
+        elif rules.reason_low.any(full_text):
             reasons.append("检测到低优先级关键词")
 
         if task_data.get("status") == "in_progress":
@@ -308,21 +279,8 @@ class AITaskParser:
         # 分析重要性（基于关键词和内容）
         full_text = f"{task_data.get('title', '')} {task_data.get('description', '')}".lower()
 
-        importance_keywords = {
-            "critical": ["关键", "核心", "必须", "紧急", "重要会议", "deadline"],
-            "high": ["重要", "优先", "主要", "会议", "演示", "汇报"],
-            "medium": ["常规", "普通", "一般", "日常"],
-            "low": ["有空", "不急", "随意", "休闲", "娱乐"]
-        }
-
-        importance = "medium"
-        for level, keywords in importance_keywords.items():
-            for keyword in keywords:
-                if keyword in full_text:
-                    importance = level
-                    break
-            if importance != "medium":
-                break
+        rules = self.rules.current
+        importance = rules.importance.first(full_text, rules.default_importance)
 
         analysis["importance"] = importance
 
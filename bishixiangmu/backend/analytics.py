@@ -0,0 +1,195 @@
+"""
+任务趋势分析模块
+按列分块读取任务数据，用 NumPy 向量化聚合：
+每日/每周新建数、完成数、逾期完成数、平均优先级（优先级漂移）、完成耗时分布
+已结束的历史时间桶结果会被缓存，不再重复计算
+"""
+
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+
+from database import get_db_connection
+
+# 每次从游标读取的行数
+CHUNK_SIZE = 50000
+
+# 完成耗时分布的区间边界（天）：[0,1) [1,2) [2,3) [3,7) [7,14) [14,30) [30,∞)
+COMPLETION_BINS = (0, 1, 2, 3, 7, 14, 30)
+COMPLETION_LABELS = ("<1d", "1-2d", "2-3d", "3-7d", "7-14d", "14-30d", ">=30d")
+
+VALID_BUCKETS = ("day", "week")
+
+# 单次查询允许的最大跨度（天），避免一次构造并缓存海量时间桶
+MAX_RANGE_DAYS = 3 * 366
+
+# 已结束时间桶的缓存：(桶类型, 桶起始日期) -> 指标；超过上限时整体清空
+MAX_CACHED_BUCKETS = 20000
+_closed_buckets: Dict[Tuple[str, date], Dict[str, Any]] = {}
+_cache_lock = threading.Lock()
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    """返回某天所在时间桶的起始日期（周以周一为起点）"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def _bucket_days(bucket: str) -> int:
+    return 7 if bucket == "week" else 1
+
+
+def _fetch_columns(conn, sql: str, params: tuple, columns: int):
+    """分块读取查询结果并拼接为 NumPy 列数组（float64，NULL 为 NaN）"""
+    import numpy as np
+
+    cursor = conn.cursor()
+    cursor.row_factory = None  # 直接取元组，省去 sqlite3.Row 的开销
+    cursor.execute(sql, params)
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.float64).reshape(-1, columns))
+    if not chunks:
+        return np.empty((0, columns))
+    return np.concatenate(chunks)
+
+
+def _compute_buckets(start: date, end: date, bucket: str) -> List[Dict[str, Any]]:
+    """计算 [start, end) 范围内所有时间桶的指标；start 必须是桶起点"""
+    import numpy as np
+
+    step = _bucket_days(bucket)
+    count = (end - start).days // step
+    origin = start.toordinal()
+    # SQLite julianday 与 Python ordinal 的换算常数
+    julian_offset = 1721424.5
+
+    # 历史趋势需要包含已归档的任务：热表和归档表分别读取后拼接
+    conn = get_db_connection(with_archive=True)
+    created_parts, completed_parts = [], []
+    for schema in ("main", "archive"):
+        # 新建任务：创建日、优先级
+        created_parts.append(_fetch_columns(conn, f'''
+            SELECT julianday(created_at), COALESCE(priority, 3) FROM {schema}.tasks
+            WHERE created_at >= ? AND created_at < ?
+        ''', (start.isoformat(), end.isoformat()), 2))
+
+        # 完成任务：按状态变为已完成时记录的 completed_at 归桶（之后编辑任务不会移动它）
+        completed_parts.append(_fetch_columns(conn, f'''
+            SELECT julianday(created_at), julianday(completed_at), julianday(due_date)
+            FROM {schema}.tasks INDEXED BY idx_completed_at
+            WHERE status = 'completed' AND completed_at >= ? AND completed_at < ?
+        ''', (start.isoformat(), end.isoformat()), 3))
+    conn.close()
+
+    created = np.concatenate(created_parts)
+    completed = np.concatenate(completed_parts)
+
+    created_idx = ((np.floor(created[:, 0] - julian_offset) - origin) // step).astype(np.int64)
+    created_count = np.bincount(created_idx, minlength=count)
+    priority_sum = np.bincount(created_idx, weights=created[:, 1], minlength=count)
+
+    done_day = np.floor(completed[:, 1] - julian_offset)
+    done_idx = ((done_day - origin) // step).astype(np.int64)
+    completed_count = np.bincount(done_idx, minlength=count)
+
+    # 完成晚于截止日期（due_date 为空时 NaN 比较结果为 False）
+    late = done_day > np.floor(completed[:, 2] - julian_offset)
+    late_count = np.bincount(done_idx, weights=late, minlength=count)
+
+    # 完成耗时分布：每个桶一行直方图，便于按桶缓存后相加
+    duration = completed[:, 1] - completed[:, 0]
+    bin_idx = np.digitize(duration, COMPLETION_BINS[1:])
+    histogram = np.zeros((count, len(COMPLETION_BINS)), dtype=np.int64)
+    np.add.at(histogram, (done_idx, bin_idx), 1)
+
+    return [
+        {
+            "start": start + timedelta(days=i * step),
+            "created": int(created_count[i]),
+            "completed": int(completed_count[i]),
+            "completed_late": int(late_count[i]),
+            "priority_sum": float(priority_sum[i]),
+            "completion_histogram": histogram[i].tolist()
+        }
+        for i in range(count)
+    ]
+
+
+def get_task_trends(date_from: date, date_to: date, bucket: str = "day") -> Dict[str, Any]:
+    """获取 [date_from, date_to] 范围内的任务趋势"""
+    if bucket not in VALID_BUCKETS:
+        raise ValueError(f"不支持的时间粒度: {bucket}")
+    if date_from > date_to:
+        raise ValueError("起始日期不能晚于结束日期")
+    if (date_to - date_from).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"时间跨度不能超过 {MAX_RANGE_DAYS} 天")
+
+    step = _bucket_days(bucket)
+    try:
+        first = bucket_start(date_from, bucket)
+        end = bucket_start(date_to, bucket) + timedelta(days=step)
+    except OverflowError:
+        raise ValueError("日期超出支持范围")
+    # 数据库时间戳为 UTC（CURRENT_TIMESTAMP），按 UTC 判断哪些桶已经结束
+    current = bucket_start(datetime.utcnow().date(), bucket)
+
+    starts = [first + timedelta(days=i * step) for i in range((end - first).days // step)]
+    with _cache_lock:
+        cached = {s: _closed_buckets[(bucket, s)] for s in starts if (bucket, s) in _closed_buckets}
+
+    # 只重新计算第一个未缓存的桶及之后的部分（通常只有当前桶）
+    missing = [s for s in starts if s not in cached]
+    if missing:
+        for result in _compute_buckets(missing[0], end, bucket):
+            if result["start"] not in cached:
+                cached[result["start"]] = result
+            if result["start"] < current:
+                with _cache_lock:
+                    if len(_closed_buckets) >= MAX_CACHED_BUCKETS:
+                        _closed_buckets.clear()
+                    _closed_buckets[(bucket, result["start"])] = result
+
+    buckets = [cached[s] for s in starts]
+    histogram = [sum(b["completion_histogram"][i] for b in buckets) for i in range(len(COMPLETION_BINS))]
+
+    return {
+        "bucket": bucket,
+        "from": first,
+        "to": end - timedelta(days=1),
+        "buckets": [
+            {
+                "start": b["start"],
+                "created": b["created"],
+                "completed": b["completed"],
+                "completed_late": b["completed_late"],
+                "avg_priority": round(b["priority_sum"] / b["created"], 2) if b["created"] else None
+            }
+            for b in buckets
+        ],
+        "completion_time_histogram": dict(zip(COMPLETION_LABELS, histogram))
+    }
+
+
+def invalidate_trend_days(days: Iterable[str]):
+    """作废包含这些日期（YYYY-MM-DD）的已缓存时间桶（修改或删除历史任务后调用）"""
+    keys = []
+    for day in days:
+        try:
+            parsed = date.fromisoformat(day)
+        except ValueError:
+            continue
+        keys.extend((bucket, bucket_start(parsed, bucket)) for bucket in VALID_BUCKETS)
+    with _cache_lock:
+        for key in keys:
+            _closed_buckets.pop(key, None)
+
+
+def clear_trend_cache():
+    """清空历史时间桶缓存（批量导入或修改历史数据后调用）"""
+    with _cache_lock:
+        _closed_buckets.clear()
@@ -3,19 +3,133 @@ AI增强型任务管理系统 - 后端API主程序
 使用 FastAPI + SQLite + AI 解析
 """
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import os
+import secrets
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field, ConfigDict
-from datetime import date, datetime
-from typing import Optional, List
-import uvicorn
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict
 
 # 导入自定义模块
 from database import (
     init_database, get_all_tasks, get_task_by_id,
-    create_task, update_task, delete_task, get_task_stats
+    create_task, delete_task, get_task_stats, find_similar_tasks
 )
 from ai_parser import AITaskParser
+from write_coalescer import UpdateCoalescer
+from task_cache import task_cache
+from ai_jobs import AIJobWorkerPool, QueueFullError, enqueue_job, get_job
+from analytics import get_task_trends
+from profiling import request_profiler, slow_query_log
+from archive import ArchiveScheduler, reconcile_archive, run_maintenance, ARCHIVE_AFTER_DAYS
+from rate_limit import RateLimiter, ConcurrencyLimiter, SingleFlight
+from dedup import DEDUP_MODE
+import backup
+
+# 管理接口（/api/admin/*）令牌：请求需带 X-Admin-Token 头；未设置时管理接口全部关闭
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# ========== 懒加载单例 ==========
+_ai_parser: Optional[AITaskParser] = None
+_update_coalescer: Optional[UpdateCoalescer] = None
+
+# AI接口准入控制：限流、并发上限、相同文本合并解析
+ai_rate_limiter = RateLimiter()
+ai_concurrency = ConcurrencyLimiter()
+parse_flights = SingleFlight()
+
+
+def get_ai_parser() -> AITaskParser:
+    """获取AI解析器单例（首次调用时才构造）"""
+    global _ai_parser
+    if _ai_parser is None:
+        _ai_parser = AITaskParser()
+    return _ai_parser
+
+
+def get_update_coalescer() -> UpdateCoalescer:
+    """获取任务更新合并器单例"""
+    global _update_coalescer
+    if _update_coalescer is None:
+        _update_coalescer = UpdateCoalescer()
+    return _update_coalescer
+
+
+def require_admin(request: Request):
+    """管理接口鉴权：未配置 ADMIN_TOKEN 时返回403，令牌不匹配返回401"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="管理接口未启用（需设置 ADMIN_TOKEN）")
+    token = request.headers.get("X-Admin-Token", "")
+    if not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="管理令牌无效")
+
+
+ADMIN_ONLY = [Depends(require_admin)]
+
+
+@asynccontextmanager
+async def ai_admission(http_request: Request, text: Optional[str] = None):
+    """
+    AI接口准入：超出速率返回429，并发已满返回503，均带 Retry-After
+    相同文本正在解析时直接共享结果，不占用并发名额
+    """
+    client = http_request.client.host if http_request.client else "unknown"
+    retry_after = ai_rate_limiter.acquire(client)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="请求过于频繁，请稍后重试",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+    if text is not None and parse_flights.pending(_parse_key(text)):
+        yield
+        return
+    if not ai_concurrency.try_acquire():
+        raise HTTPException(
+            status_code=503,
+            detail="AI服务繁忙，请稍后重试",
+            headers={"Retry-After": "1"}
+        )
+    try:
+        yield
+    finally:
+        ai_concurrency.release()
+
+
+def _parse_key(text: str) -> str:
+    """合并解析用的键：包含规则版本，规则更新后不会复用旧规则的解析结果"""
+    return f"{get_ai_parser().rules.version}:{text}"
+
+
+async def parse_text(text: str) -> dict:
+    """解析并验证文本；并发的相同文本只解析一次"""
+    ai_parser = get_ai_parser()
+    parsed_data = await parse_flights.run(_parse_key(text), lambda _: ai_parser.parse(text))
+    return ai_parser.validate_task_data(parsed_data)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时初始化数据库和解析器，完成后标记就绪"""
+    app.state.ready = False
+    init_database()
+    reconcile_archive()
+    get_ai_parser()
+    app.state.ai_jobs = AIJobWorkerPool(get_ai_parser)
+    await app.state.ai_jobs.start()
+    app.state.archiver = ArchiveScheduler()
+    await app.state.archiver.start()
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    await app.state.archiver.stop()
+    await app.state.ai_jobs.stop()
+
 
 # ========== 初始化应用 ==========
 app = FastAPI(
@@ -23,7 +137,8 @@ app = FastAPI(
     description="支持自然语言解析的智能任务管理API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 配置CORS（允许前端跨域访问）
@@ -35,11 +150,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化数据库
-init_database()
-
-# 初始化AI解析器
-ai_parser = AITaskParser()
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """请求带 X-Profile: 1 头或 ?profile=1 时剖析本次请求（需设置 PROFILING_ENABLED=1）"""
+    if request_profiler.wants_profile(request.headers, request.query_params):
+        return await request_profiler.run(request.method, request.url.path, call_next, request)
+    return await call_next(request)
 
 # ========== 数据模型定义 ==========
 class TaskStatus(str):
@@ -68,9 +184,17 @@ class TaskResponse(TaskBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    completed_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
 
+class SimilarTask(TaskResponse):
+    similarity: float = Field(..., description="标题的 Jaccard 相似度")
+
+class AITaskResponse(TaskResponse):
+    duplicate_of: List[int] = Field(default_factory=list, description="疑似重复的未完成任务ID")
+    merged: bool = Field(False, description="是否合并到了已有任务（未新建）")
+
 class PriorityRecommendation(BaseModel):
     current_priority: int
     recommended_priority: int
@@ -85,6 +209,16 @@ class AIResponse(BaseModel):
     result: TaskBase
     message: str
 
+class AIJobResponse(BaseModel):
+    id: int
+    text: str
+    status: str = Field(..., description="作业状态: queued, running, done, failed")
+    task_id: Optional[int] = None
+    error: Optional[str] = None
+    task: Optional[TaskResponse] = None
+    created_at: datetime
+    updated_at: datetime
+
 class StatsResponse(BaseModel):
     total: int
     completed: int
@@ -93,6 +227,20 @@ class StatsResponse(BaseModel):
     overdue: int
     completion_rate: float
 
+class TrendBucket(BaseModel):
+    start: date
+    created: int
+    completed: int
+    completed_late: int
+    avg_priority: Optional[float] = None
+
+class TrendsResponse(BaseModel):
+    bucket: str
+    date_from: date = Field(..., alias="from")
+    date_to: date = Field(..., alias="to")
+    buckets: List[TrendBucket]
+    completion_time_histogram: Dict[str, int]
+
 # ========== API路由定义 ==========
 
 @app.get("/", tags=["根路径"])
@@ -105,6 +253,7 @@ async def root():
         "endpoints": {
             "文档": "/docs",
             "健康检查": "/health",
+            "就绪检查": "/ready",
             "任务列表": "/api/tasks",
             "AI解析": "/api/ai/parse",
             "统计信息": "/api/stats"
@@ -120,29 +269,62 @@ async def health_check():
         "service": "ai-task-manager"
     }
 
+@app.get("/ready", tags=["系统"])
+async def readiness_check():
+    """就绪检查端点：数据库和解析器初始化完成前返回503"""
+    ready = getattr(app.state, "ready", False)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "starting",
+            "timestamp": datetime.now().isoformat(),
+            "service": "ai-task-manager"
+        }
+    )
+
+@app.get("/api/cache/stats", tags=["系统"])
+async def cache_statistics():
+    """任务缓存状态：容量、命中次数和命中率"""
+    return task_cache.stats()
+
 @app.get("/api/tasks", response_model=List[TaskResponse], tags=["任务管理"])
-async def read_tasks(status: Optional[str] = None):
+async def read_tasks(status: Optional[str] = None, include_archived: bool = False):
     """
     获取任务列表
 
     - **status**: 可选，按状态筛选 (pending, in_progress, completed)
+    - **include_archived**: 是否包含已归档的已完成任务
     """
     try:
-        tasks = get_all_tasks(status)
+        tasks = get_all_tasks(status, include_archived)
         return tasks
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取任务失败: {str(e)}")
 
 @app.get("/api/tasks/{task_id}", response_model=TaskResponse, tags=["任务管理"])
-async def read_task(task_id: int):
+async def read_task(task_id: int, include_archived: bool = False):
     """
     获取单个任务详情
     """
-    task = get_task_by_id(task_id)
+    task = get_task_by_id(task_id, include_archived)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     return task
 
+@app.get("/api/tasks/{task_id}/similar", response_model=List[SimilarTask], tags=["任务管理"])
+async def read_similar_tasks(
+    task_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    include_completed: bool = True
+):
+    """
+    获取与该任务标题相似的任务（按相似度降序）
+    """
+    task = get_task_by_id(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return find_similar_tasks(task["title"], task_id, include_completed, limit)
+
 @app.post("/api/tasks", response_model=TaskResponse, tags=["任务管理"])
 async def create_new_task(task: TaskCreate):
     """
@@ -165,7 +347,8 @@ async def update_existing_task(task_id: int, task_update: TaskUpdate):
     if not update_data:
         raise HTTPException(status_code=400, detail="没有提供更新数据")
 
-    updated_task = update_task(task_id, update_data)
+    # 短时间内对同一任务的连续修改会合并为一次写入
+    updated_task = await get_update_coalescer().update(task_id, update_data)
     if not updated_task:
         raise HTTPException(status_code=404, detail="任务不存在或更新失败")
 
@@ -183,7 +366,7 @@ async def remove_task(task_id: int):
     return {"success": True, "message": "任务删除成功", "task_id": task_id}
 
 @app.post("/api/ai/parse", response_model=AIResponse, tags=["AI功能"])
-async def parse_natural_language(request: NaturalLanguageRequest):
+async def parse_natural_language(request: NaturalLanguageRequest, http_request: Request):
     """
     AI解析自然语言为任务
 
@@ -194,49 +377,216 @@ async def parse_natural_language(request: NaturalLanguageRequest):
     }
     ```
     """
-    try:
-        # 使用AI解析器解析文本
-        parsed_data = ai_parser.parse(request.text)
-
-        # 验证数据
-        validated_data = ai_parser.validate_task_data(parsed_data)
-
-        return AIResponse(
-            success=True,
-            result=TaskBase(**validated_data),
-            message="AI解析成功" if ai_parser.use_real_api else "模拟AI解析成功"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI解析失败: {str(e)}")
-
-@app.post("/api/ai/create", response_model=TaskResponse, tags=["AI功能"])
-async def create_task_from_natural_language(request: NaturalLanguageRequest):
+    async with ai_admission(http_request, request.text):
+        try:
+            # 使用AI解析器解析文本并验证数据
+            validated_data = await parse_text(request.text)
+
+            return AIResponse(
+                success=True,
+                result=TaskBase(**validated_data),
+                message="AI解析成功" if get_ai_parser().use_real_api else "模拟AI解析成功"
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"AI解析失败: {str(e)}")
+
+@app.post("/api/ai/create", response_model=AITaskResponse, tags=["AI功能"])
+async def create_task_from_natural_language(
+    request: NaturalLanguageRequest,
+    http_request: Request,
+    run_async: bool = Query(False, alias="async", description="异步模式：只入队并返回作业ID"),
+    dedup: str = Query(DEDUP_MODE, pattern="^(flag|merge|off)$", description="重复任务处理: flag, merge, off")
+):
     """
     直接从自然语言创建任务（一步完成）
+
+    - **async=true**: 立即返回 202 和作业ID，通过 /api/ai/jobs/{job_id} 查询结果
+    - **dedup**: 与未完成任务标题相似时，flag 照常创建并在 duplicate_of 中列出，
+      merge 不新建而是把更高的优先级、缺失的截止日期合并到最相似的任务
     """
-    try:
-        # 解析自然语言
-        parsed_data = ai_parser.parse(request.text)
-        validated_data = ai_parser.validate_task_data(parsed_data)
+    async with ai_admission(http_request, None if run_async else request.text):
+        if run_async:
+            try:
+                job = enqueue_job(request.text)
+            except QueueFullError as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+            app.state.ai_jobs.notify()
+            return JSONResponse(
+                status_code=202,
+                content={"job_id": job["id"], "status": job["status"]}
+            )
+
+        try:
+            # 解析自然语言
+            validated_data = await parse_text(request.text)
+
+            # 查重
+            duplicates = []
+            if dedup != "off":
+                duplicates = find_similar_tasks(validated_data["title"], include_completed=False)
+            duplicate_ids = [task["id"] for task in duplicates]
+
+            if dedup == "merge" and duplicates:
+                merged_task = await _merge_into(duplicates[0], validated_data)
+                return {**merged_task, "duplicate_of": duplicate_ids, "merged": True}
+
+            # 创建任务
+            new_task = create_task(validated_data)
+
+            return {**new_task, "duplicate_of": duplicate_ids}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"创建任务失败: {str(e)}")
+
+async def _merge_into(existing: dict, data: dict) -> dict:
+    """把新解析的任务合并到已有任务：保留更高的优先级，补上缺失的截止日期"""
+    update_data = {}
+    if data.get("priority") and data["priority"] < existing["priority"]:
+        update_data["priority"] = data["priority"]
+    if data.get("due_date") and not existing.get("due_date"):
+        update_data["due_date"] = data["due_date"]
+    if not update_data:
+        return existing
+    return await get_update_coalescer().update(existing["id"], update_data) or existing
+
+@app.get("/api/ai/jobs/{job_id}", response_model=AIJobResponse, tags=["AI功能"])
+async def read_ai_job(
+    job_id: int,
+    wait: float = Query(0, ge=0, le=30, description="最多等待作业完成的秒数（长轮询）")
+):
+    """
+    查询异步AI创建作业的状态，完成后附带创建的任务
+    """
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="作业不存在")
 
-        # 创建任务
-        new_task = create_task(validated_data)
+    deadline = asyncio.get_running_loop().time() + wait
+    while job["status"] in ("queued", "running") and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.1)
+        job = get_job(job_id)
 
-        return new_task
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"创建任务失败: {str(e)}")
+    if job["task_id"]:
+        job["task"] = get_task_by_id(job["task_id"])
+    return job
 
 @app.get("/api/stats", response_model=StatsResponse, tags=["统计"])
-async def get_statistics():
+async def get_statistics(include_archived: bool = False):
     """
     获取任务统计信息
     """
     try:
-        stats = get_task_stats()
+        stats = get_task_stats(include_archived)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取统计信息失败: {str(e)}")
 
+@app.get("/api/stats/trends", response_model=TrendsResponse, response_model_by_alias=True, tags=["统计"])
+async def get_trends(
+    date_from: Optional[date] = Query(None, alias="from", description="起始日期，默认30天前"),
+    date_to: Optional[date] = Query(None, alias="to", description="结束日期，默认今天"),
+    bucket: str = Query("day", pattern="^(day|week)$", description="时间粒度: day, week")
+):
+    """
+    获取任务趋势：每个时间桶的新建数、完成数、逾期完成数、平均优先级，以及完成耗时分布
+    """
+    try:
+        date_to = date_to or date.today()
+        date_from = date_from or date_to - timedelta(days=29)
+        return get_task_trends(date_from, date_to, bucket)
+    except OverflowError:
+        raise HTTPException(status_code=400, detail="日期超出支持范围")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/admin/slow-operations", dependencies=ADMIN_ONLY, tags=["系统"])
+async def list_slow_operations(
+    limit: int = Query(20, ge=1, le=200),
+    order_by: str = Query("max_ms", pattern="^(max_ms|total_ms|avg_ms|count|slow_count)$")
+):
+    """
+    数据库操作耗时排行，以及最近超过阈值（SLOW_QUERY_MS）的慢操作明细
+    """
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "top": slow_query_log.top_operations(limit, order_by),
+        "recent": list(slow_query_log.recent)[-limit:]
+    }
+
+@app.post("/api/admin/archive", dependencies=ADMIN_ONLY, tags=["系统"])
+async def archive_tasks(older_than_days: int = Query(ARCHIVE_AFTER_DAYS, ge=0)):
+    """
+    立即归档完成超过指定天数的任务，并回收数据库空间
+    """
+    return await asyncio.to_thread(run_maintenance, older_than_days)
+
+@app.post("/api/admin/backups", dependencies=ADMIN_ONLY, tags=["系统"])
+async def create_backup():
+    """
+    创建在线增量快照（备份期间不阻塞写入）
+    """
+    return await asyncio.to_thread(backup.create_snapshot)
+
+@app.get("/api/admin/backups", dependencies=ADMIN_ONLY, tags=["系统"])
+async def list_backups():
+    """快照列表（从新到旧）"""
+    return await asyncio.to_thread(backup.list_snapshots)
+
+@app.post("/api/admin/backups/{snapshot_id}/restore", dependencies=ADMIN_ONLY, tags=["系统"])
+async def restore_backup(snapshot_id: str):
+    """
+    用快照整体替换当前数据库
+    """
+    return await _run_backup_action(backup.restore_snapshot, snapshot_id)
+
+@app.post("/api/admin/backups/{snapshot_id}/import", dependencies=ADMIN_ONLY, tags=["系统"])
+async def import_backup(snapshot_id: str):
+    """
+    把快照中的任务导入当前数据库（已存在的任务ID跳过）
+    """
+    return await _run_backup_action(backup.import_snapshot_tasks, snapshot_id)
+
+async def _run_backup_action(action, snapshot_id: str):
+    try:
+        return await asyncio.to_thread(action, snapshot_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/profiles", dependencies=ADMIN_ONLY, tags=["系统"])
+async def list_profiles():
+    """已保存的请求剖析结果（不含详细统计）"""
+    return [
+        {key: value for key, value in profile.items() if key != "stats"}
+        for profile in request_profiler.profiles
+    ]
+
+@app.get("/api/admin/profiles/{profile_id}", response_class=PlainTextResponse, dependencies=ADMIN_ONLY, tags=["系统"])
+async def read_profile(profile_id: int):
+    """单个请求的 cProfile 统计（按累计耗时排序）"""
+    profile = request_profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="剖析结果不存在")
+    return f"{profile['method']} {profile['path']} {profile['duration_ms']} ms\n\n{profile['stats']}"
+
+
+@app.get("/api/admin/parser-rules", dependencies=ADMIN_ONLY, tags=["系统"])
+async def read_parser_rules():
+    """当前生效的解析规则版本（规则文件修改后自动热重载）"""
+    rules = get_ai_parser().rules
+    return {"version": rules.version, "path": rules.path}
+
+@app.post("/api/admin/parser-rules/reload", dependencies=ADMIN_ONLY, tags=["系统"])
+async def reload_parser_rules():
+    """
+    立即重新加载解析规则文件（加载失败时保留当前规则并返回400）
+    """
+    rules = get_ai_parser().rules
+    if not rules.reload():
+        raise HTTPException(status_code=400, detail=f"规则加载失败，继续使用版本 {rules.version}")
+    return {"version": rules.version, "path": rules.path}
+
 
 # 在现有API路由后添加：
 
@@ -250,7 +600,7 @@ async def get_priority_recommendation(task_id: int):
         raise HTTPException(status_code=404, detail="任务不存在")
 
     # 使用AI解析器推荐优先级
-    recommended = ai_parser.recommend_priority(task)
+    recommended = get_ai_parser().recommend_priority(task)
 
     # 生成推荐理由
     reasons = {
@@ -286,11 +636,11 @@ async def auto_prioritize_task(task_id: int):
         raise HTTPException(status_code=404, detail="任务不存在")
 
     # 获取AI推荐优先级
-    recommended = ai_parser.recommend_priority(task)
+    recommended = get_ai_parser().recommend_priority(task)
 
     # 更新任务优先级
     update_data = {"priority": recommended}
-    updated_task = update_task(task_id, update_data)
+    updated_task = await get_update_coalescer().update(task_id, update_data)
 
     if not updated_task:
         raise HTTPException(status_code=500, detail="优先级更新失败")
@@ -312,16 +662,21 @@ if __name__ == "__main__":
     print("📋 可用端点:")
     print("  GET  /                    - API信息")
     print("  GET  /health              - 健康检查")
+    print("  GET  /ready               - 就绪检查")
     print("  GET  /api/tasks           - 获取任务列表")
     print("  POST /api/tasks           - 创建任务")
+    print("  GET  /api/tasks/{id}/similar - 相似任务（查重）")
     print("  POST /api/ai/parse        - AI解析自然语言")
-    print("  POST /api/ai/create       - AI直接创建任务")
+    print("  POST /api/ai/create       - AI直接创建任务（?async=true 异步入队）")
+    print("  GET  /api/ai/jobs/{id}    - 查询AI异步作业")
     print("  GET  /api/stats           - 统计信息")
+    print("  GET  /api/stats/trends    - 任务趋势分析")
     print("=" * 70)
     print("按下 Ctrl+C 停止服务器")
     print("=" * 70)
 
-    # 启动服务器
+    # 启动服务器（uvicorn 仅在直接运行时导入）
+    import uvicorn
     uvicorn.run(
         app,
         host="0.0.0.0",
@@ -0,0 +1,185 @@
+"""
+任务归档模块
+把完成超过一定天数的任务分批移到挂载的归档库，保持热表 tasks 精简；
+定期执行归档和空间回收（增量 VACUUM）
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import database
+import dedup
+from ai_jobs import prune_finished_jobs
+from database import get_db_connection, TASK_COLUMNS
+from task_cache import task_cache
+
+# 完成多少天后归档
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+
+# 每批移动的任务数（每批一个事务，批次之间释放写锁）
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+# 自动归档与压缩的间隔（秒），设为 0 则只能通过管理接口手动触发
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "86400"))
+
+# 非增量模式的数据库空闲页占比超过该值时执行完整 VACUUM
+VACUUM_FREE_RATIO = 0.25
+
+# 增量 VACUUM 每步回收的页数
+INCREMENTAL_VACUUM_PAGES = 500
+
+
+def archive_completed_tasks(older_than_days: int = ARCHIVE_AFTER_DAYS,
+                            batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    把完成超过 older_than_days 天的任务移到归档库，返回移动数量
+
+    WAL 模式下跨挂载库的提交对每个库分别原子，整体并不原子，因此每批分两步提交：
+    先写入归档库（OR REPLACE，可重复执行），再从热库删除已在归档库中的任务。
+    中途崩溃最多使任务同时存在于两个库，下次归档或启动时的 reconcile_archive 会清理
+    """
+    # completed_at 由 CURRENT_TIMESTAMP 写入，是 UTC 时间
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = get_db_connection(with_archive=True)
+    cursor = conn.cursor()
+    total = 0
+
+    while True:
+        cursor.execute('''
+            SELECT id FROM main.tasks INDEXED BY idx_completed_at
+            WHERE status = 'completed' AND completed_at < ?
+            LIMIT ?
+        ''', (cutoff, batch_size))
+        rows = cursor.fetchall()
+        ids = [row['id'] for row in rows]
+        if not ids:
+            break
+
+        placeholders = ", ".join("?" * len(ids))
+        cursor.execute(
+            f"INSERT OR REPLACE INTO archive.tasks ({TASK_COLUMNS}) "
+            f"SELECT {TASK_COLUMNS} FROM main.tasks WHERE id IN ({placeholders})",
+            ids
+        )
+        conn.commit()
+        total += _delete_archived(cursor, ids)
+        conn.commit()
+
+        if len(ids) < batch_size:
+            break
+
+    conn.close()
+    return total
+
+
+def _delete_archived(cursor, ids: List[int]) -> int:
+    """从热库删除已经写入归档库的任务（调用方提交），返回删除数量"""
+    placeholders = ", ".join("?" * len(ids))
+    cursor.execute(
+        f"DELETE FROM main.tasks WHERE id IN ({placeholders}) "
+        f"AND EXISTS (SELECT 1 FROM archive.tasks AS a WHERE a.id = main.tasks.id) RETURNING id",
+        ids
+    )
+    deleted = [row["id"] for row in cursor.fetchall()]
+    dedup.remove_tasks(cursor, deleted)  # 归档任务不再参与查重
+    for task_id in deleted:
+        task_cache.invalidate(task_id)
+    return len(deleted)
+
+
+def reconcile_archive() -> int:
+    """
+    清理同时存在于热库和归档库的任务（归档中途崩溃的残留），以归档库中的副本为准
+    启动时调用一次，返回清理数量
+    """
+    if not os.path.exists(database.ARCHIVE_DB_PATH):
+        return 0
+    conn = get_db_connection(with_archive=True)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM main.tasks WHERE id IN (SELECT id FROM archive.tasks)")
+    ids = [row["id"] for row in cursor.fetchall()]
+    removed = 0
+    for i in range(0, len(ids), ARCHIVE_BATCH_SIZE):
+        removed += _delete_archived(cursor, ids[i:i + ARCHIVE_BATCH_SIZE])
+        conn.commit()
+    conn.close()
+    if removed:
+        print(f"🧹 清理了 {removed} 个已归档但仍在热库中的任务")
+    return removed
+
+
+def compact_database() -> Dict[str, Any]:
+    """
+    回收热库和归档库的空闲页
+    增量模式的库分步执行 incremental_vacuum，不长时间占用写锁；
+    其他库仅在空闲页占比较高时执行一次完整 VACUUM，并同时切换为增量模式，
+    之后的回收都走 incremental_vacuum
+    """
+    conn = get_db_connection(with_archive=True)
+    result = {}
+
+    for schema in ("main", "archive"):
+        auto_vacuum = conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0]
+        page_count = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+        freelist = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+
+        if auto_vacuum == 2:  # INCREMENTAL
+            while freelist > 0:
+                conn.execute(f"PRAGMA {schema}.incremental_vacuum({INCREMENTAL_VACUUM_PAGES})").fetchall()
+                conn.commit()
+                freelist = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+            mode = "incremental"
+        elif page_count and freelist / page_count >= VACUUM_FREE_RATIO:
+            # auto_vacuum 从 NONE 切换为 INCREMENTAL 只在随后的 VACUUM 中生效
+            conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+            conn.execute(f"VACUUM {schema}")
+            mode = "full"
+        else:
+            mode = "skipped"
+
+        result[schema] = {
+            "mode": mode,
+            "pages_before": page_count,
+            "pages_after": conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+        }
+
+    conn.close()
+    return result
+
+
+def run_maintenance(older_than_days: int = ARCHIVE_AFTER_DAYS) -> Dict[str, Any]:
+    """归档 + 清理过期的AI作业记录 + 压缩"""
+    archived = archive_completed_tasks(older_than_days)
+    pruned_jobs = prune_finished_jobs()
+    compaction = compact_database()
+    print(f"🗄️ 归档完成: 移动 {archived} 个任务，清理 {pruned_jobs} 条AI作业记录")
+    return {"archived": archived, "pruned_jobs": pruned_jobs, "compaction": compaction}
+
+
+class ArchiveScheduler:
+    """按固定间隔在后台线程中执行归档和压缩"""
+
+    def __init__(self, interval: float = ARCHIVE_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(run_maintenance)
+            except Exception as e:
+                print(f"❌ 归档失败: {e}")
@@ -0,0 +1,350 @@
+"""
+数据库备份与恢复模块
+1. 在线备份：固定一个 WAL 读快照，用 sqlite3 backup API 按页分步复制，不阻塞写入
+2. 增量快照：备份文件按块切分、压缩后按内容哈希存储，未变化的块在快照之间复用
+3. 恢复：整库恢复（backup API 写回），或把快照中的任务批量导入当前库（大批量时延迟重建索引）
+
+命令行用法:
+    python backup.py create
+    python backup.py list
+    python backup.py restore <快照ID>
+    python backup.py import <快照ID>
+    python backup.py prune <保留个数>
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import database
+import dedup
+from database import get_db_connection, TASK_COLUMNS, TASK_INDEXES
+from task_cache import task_cache
+
+# 备份目录：chunks/ 存放压缩块，snapshots/ 存放快照清单
+BACKUP_DIR = os.getenv("TASKS_BACKUP_DIR", "backups")
+
+# 每步复制的页数，以及每步之间让出的时间（毫秒）
+PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "1024"))
+STEP_PAUSE = float(os.getenv("BACKUP_STEP_PAUSE_MS", "1")) / 1000
+
+# 增量块大小（字节，16 个 4KB 页）和压缩级别；块越小，分散写入后需要重新存储的数据越少
+CHUNK_SIZE = 64 * 1024
+COMPRESS_LEVEL = 6
+
+# 导入时延迟重建索引的条件：导入行数不少于 DEFER_INDEX_MIN_ROWS，且不少于热表现有行数的 DEFER_INDEX_RATIO 倍
+# （重建要扫描整张热表；小批量导入时逐行维护索引更快）
+DEFER_INDEX_MIN_ROWS = int(os.getenv("IMPORT_DEFER_INDEX_MIN_ROWS", "50000"))
+DEFER_INDEX_RATIO = 0.5
+
+SNAPSHOT_ID_PATTERN = re.compile(r"^\d{8}-\d{6}-\d{6}$")
+
+
+def _snapshots_dir() -> str:
+    return os.path.join(BACKUP_DIR, "snapshots")
+
+
+def _chunk_path(digest: str) -> str:
+    return os.path.join(BACKUP_DIR, "chunks", digest[:2], f"{digest}.z")
+
+
+def _manifest_path(snapshot_id: str) -> str:
+    if not SNAPSHOT_ID_PATTERN.match(snapshot_id):
+        raise ValueError(f"无效的快照ID: {snapshot_id}")
+    return os.path.join(_snapshots_dir(), f"{snapshot_id}.json")
+
+
+def _online_copy(conn: sqlite3.Connection, schema: str, dest_path: str):
+    """
+    把 conn 上的 schema 库复制到 dest_path
+    先开启读事务固定快照：WAL 模式下写入继续进行，备份也不会因源库变化而反复重启
+    """
+    dest = sqlite3.connect(dest_path)
+    conn.execute("BEGIN")
+    conn.execute(f"SELECT COUNT(*) FROM {schema}.sqlite_master").fetchone()
+    try:
+        conn.backup(dest, pages=PAGES_PER_STEP, name=schema,
+                    progress=lambda status, remaining, total: time.sleep(STEP_PAUSE))
+    finally:
+        conn.rollback()
+        dest.close()
+
+
+def _store_chunks(path: str) -> Dict[str, Any]:
+    """切块、压缩并存储文件；已存在的块直接复用"""
+    digests = []
+    new_chunks = 0
+    stored_bytes = 0
+
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest = hashlib.sha256(chunk).hexdigest()
+            digests.append(digest)
+
+            chunk_path = _chunk_path(digest)
+            if os.path.exists(chunk_path):
+                continue
+            os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+            data = zlib.compress(chunk, COMPRESS_LEVEL)
+            with open(chunk_path + ".tmp", "wb") as out:
+                out.write(data)
+            os.replace(chunk_path + ".tmp", chunk_path)
+            new_chunks += 1
+            stored_bytes += len(data)
+
+    return {
+        "size": os.path.getsize(path),
+        "chunks": digests,
+        "new_chunks": new_chunks,
+        "stored_bytes": stored_bytes
+    }
+
+
+def _materialize(entry: Dict[str, Any], dest_path: str):
+    """按清单把压缩块还原为数据库文件，并校验每块的哈希"""
+    with open(dest_path, "wb") as out:
+        for digest in entry["chunks"]:
+            with open(_chunk_path(digest), "rb") as f:
+                chunk = zlib.decompress(f.read())
+            if hashlib.sha256(chunk).hexdigest() != digest:
+                raise ValueError(f"备份块校验失败: {digest}")
+            out.write(chunk)
+
+    conn = sqlite3.connect(dest_path)
+    result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    conn.close()
+    if result != "ok":
+        raise ValueError(f"快照数据库校验失败: {result}")
+
+
+def create_snapshot() -> Dict[str, Any]:
+    """创建一个增量快照（包含热库，以及存在时的归档库）"""
+    snapshot_id = datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
+    os.makedirs(_snapshots_dir(), exist_ok=True)
+    with_archive = os.path.exists(database.ARCHIVE_DB_PATH)
+    started = time.perf_counter()
+
+    manifest = {
+        "id": snapshot_id,
+        "created_at": datetime.utcnow().isoformat(),
+        "chunk_size": CHUNK_SIZE,
+        "databases": {}
+    }
+
+    conn = get_db_connection(with_archive=with_archive)
+    with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as tmp:
+        for schema in (("main", "archive") if with_archive else ("main",)):
+            copy_path = os.path.join(tmp, f"{schema}.db")
+            _online_copy(conn, schema, copy_path)
+            manifest["databases"][schema] = _store_chunks(copy_path)
+    conn.close()
+
+    manifest["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    with open(_manifest_path(snapshot_id), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    return _summary(manifest)
+
+
+def _summary(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """快照清单的摘要（不含块列表）"""
+    databases = manifest["databases"].values()
+    return {
+        "id": manifest["id"],
+        "created_at": manifest["created_at"],
+        "databases": list(manifest["databases"]),
+        "size": sum(entry["size"] for entry in databases),
+        "new_chunks": sum(entry["new_chunks"] for entry in databases),
+        "stored_bytes": sum(entry["stored_bytes"] for entry in databases),
+        "duration_ms": manifest.get("duration_ms")
+    }
+
+
+def load_manifest(snapshot_id: str) -> Dict[str, Any]:
+    path = _manifest_path(snapshot_id)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"快照不存在: {snapshot_id}")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_snapshots() -> List[Dict[str, Any]]:
+    """按时间从新到旧列出快照"""
+    if not os.path.isdir(_snapshots_dir()):
+        return []
+    ids = sorted((name[:-5] for name in os.listdir(_snapshots_dir()) if name.endswith(".json")), reverse=True)
+    return [_summary(load_manifest(snapshot_id)) for snapshot_id in ids]
+
+
+def restore_snapshot(snapshot_id: str) -> Dict[str, Any]:
+    """
+    用快照整体替换当前数据库（恢复期间目标库不可写）
+    快照中没有归档库时（创建快照时尚未归档过）清空当前归档表，
+    否则快照之后归档的任务会同时存在于热库和归档库
+    """
+    manifest = load_manifest(snapshot_id)
+    targets = {"main": database.DB_PATH, "archive": database.ARCHIVE_DB_PATH}
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as tmp:
+        for schema, entry in manifest["databases"].items():
+            restored_path = os.path.join(tmp, f"{schema}.db")
+            _materialize(entry, restored_path)
+
+            source = sqlite3.connect(restored_path)
+            target = sqlite3.connect(targets[schema], timeout=30)
+            source.backup(target, pages=PAGES_PER_STEP)
+            source.close()
+            target.close()
+
+    if "archive" not in manifest["databases"] and os.path.exists(targets["archive"]):
+        _clear_archive(targets["archive"])
+
+    # 快照可能来自旧版本的表结构，下次获取连接时重新执行建表和迁移
+    database._db_initialized = False
+    _invalidate_caches()
+    return {"id": snapshot_id, "restored": list(manifest["databases"]),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def _snapshot_columns(conn: sqlite3.Connection) -> str:
+    """快照中任务表的查询列；没有 completed_at 列的旧快照用 updated_at 近似完成时间"""
+    columns = {row[1] for row in conn.execute("PRAGMA snapshot.table_info(tasks)")}
+    if "completed_at" in columns:
+        return TASK_COLUMNS
+    return TASK_COLUMNS.replace("completed_at", "CASE WHEN status = 'completed' THEN updated_at END")
+
+
+def _clear_archive(path: str):
+    """清空归档表（保留文件，已挂载它的连接不受影响）"""
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks'").fetchone():
+            conn.execute("DELETE FROM tasks")
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def import_snapshot_tasks(snapshot_id: str, defer_indexes: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    把快照热库中的任务批量导入当前库（ID 已存在或已归档的跳过）
+    大批量导入（相对热表而言）时先删除二级索引、导入后一次性重建，比逐行维护索引快得多；
+    defer_indexes 为 None 时按 DEFER_INDEX_MIN_ROWS / DEFER_INDEX_RATIO 自动选择
+    删除索引、插入和重建在同一个显式事务中，失败回滚时索引随之恢复
+    """
+    manifest = load_manifest(snapshot_id)
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as tmp:
+        snapshot_path = os.path.join(tmp, "main.db")
+        _materialize(manifest["databases"]["main"], snapshot_path)
+
+        # 挂载归档库：快照之后已归档的任务不能再导回热库
+        conn = get_db_connection(with_archive=True)
+        conn.execute("ATTACH DATABASE ? AS snapshot", (snapshot_path,))
+        cursor = conn.cursor()
+        try:
+            # sqlite3 模块不会为 DDL 隐式开启事务，必须显式 BEGIN，否则 DROP INDEX 会立即提交
+            conn.execute("BEGIN")
+            if defer_indexes is None:
+                incoming = cursor.execute("SELECT COUNT(*) FROM snapshot.tasks").fetchone()[0]
+                existing = cursor.execute("SELECT COUNT(*) FROM main.tasks").fetchone()[0]
+                defer_indexes = incoming >= DEFER_INDEX_MIN_ROWS and incoming >= existing * DEFER_INDEX_RATIO
+            if defer_indexes:
+                for name in TASK_INDEXES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {name}")
+            # RETURNING 只返回实际插入的行，只为这些任务写查重索引
+            cursor.execute(
+                f"INSERT OR IGNORE INTO main.tasks ({TASK_COLUMNS}) "
+                f"SELECT {_snapshot_columns(conn)} FROM snapshot.tasks "
+                f"WHERE id NOT IN (SELECT id FROM archive.tasks) "
+                f"RETURNING id, title"
+            )
+            inserted = cursor.fetchall()
+            if defer_indexes:
+                for ddl in TASK_INDEXES.values():
+                    cursor.execute(ddl)
+            dedup.index_tasks(cursor, inserted)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # 兜底：无论成功与否都确保索引存在（查询依赖 INDEXED BY idx_completed_at）
+            for ddl in TASK_INDEXES.values():
+                conn.execute(ddl)
+            conn.commit()
+            conn.execute("DETACH DATABASE snapshot")
+            conn.close()
+
+    _invalidate_caches()
+    return {"id": snapshot_id, "imported": len(inserted), "deferred_indexes": defer_indexes,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def prune_snapshots(keep: int) -> Dict[str, int]:
+    """只保留最新的 keep 个快照，并删除不再被引用的块"""
+    snapshots = list_snapshots()
+    removed = 0
+    for snapshot in snapshots[keep:]:
+        os.remove(_manifest_path(snapshot["id"]))
+        removed += 1
+
+    referenced = set()
+    for snapshot in snapshots[:keep]:
+        for entry in load_manifest(snapshot["id"])["databases"].values():
+            referenced.update(entry["chunks"])
+
+    freed_chunks = 0
+    chunks_dir = os.path.join(BACKUP_DIR, "chunks")
+    for root, _, files in os.walk(chunks_dir):
+        for name in files:
+            if name.endswith(".z") and name[:-2] not in referenced:
+                os.remove(os.path.join(root, name))
+                freed_chunks += 1
+
+    return {"removed_snapshots": removed, "freed_chunks": freed_chunks}
+
+
+def _invalidate_caches():
+    """数据被整体替换后清空进程内缓存"""
+    from analytics import clear_trend_cache
+
+    task_cache.clear()
+    clear_trend_cache()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="任务数据库备份工具")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="创建增量快照")
+    commands.add_parser("list", help="列出快照")
+    commands.add_parser("restore", help="用快照替换当前数据库").add_argument("snapshot_id")
+    commands.add_parser("import", help="把快照中的任务导入当前数据库").add_argument("snapshot_id")
+    commands.add_parser("prune", help="只保留最新的 N 个快照").add_argument("keep", type=int)
+    args = parser.parse_args()
+
+    if args.command == "create":
+        result = create_snapshot()
+    elif args.command == "list":
+        result = list_snapshots()
+    elif args.command == "restore":
+        result = restore_snapshot(args.snapshot_id)
+    elif args.command == "import":
+        result = import_snapshot_tasks(args.snapshot_id)
+    else:
+        result = prune_snapshots(args.keep)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -2,23 +2,122 @@
 数据库操作模块
 """
 
+import os
 import sqlite3
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+import dedup
+from task_cache import task_cache
+from profiling import connection_factory
 
-def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect('tasks.db')
+# 数据库文件路径（可通过环境变量覆盖，便于测试和基准测试）
+DB_PATH = os.getenv("TASKS_DB_PATH", "tasks.db")
+
+# 归档库路径：已完成的旧任务移到这里，保持 tasks 表精简
+ARCHIVE_DB_PATH = os.getenv("TASKS_ARCHIVE_DB_PATH", "tasks_archive.db")
+
+# 任务表字段（热表与归档表共有）
+TASK_COLUMNS = "id, title, description, status, due_date, priority, created_at, updated_at, completed_at"
+
+# tasks 表的二级索引：名称 -> 建索引语句（批量导入时先删除、导入后重建）
+TASK_INDEXES = {
+    "idx_status": 'CREATE INDEX IF NOT EXISTS idx_status ON tasks(status)',
+    "idx_due_date": 'CREATE INDEX IF NOT EXISTS idx_due_date ON tasks(due_date)',
+    # 趋势分析用覆盖索引：按创建时间/完成时间范围读取时无需回表
+    "idx_created_at": 'CREATE INDEX IF NOT EXISTS idx_created_at ON tasks(created_at, priority)',
+    "idx_completed_at": """CREATE INDEX IF NOT EXISTS idx_completed_at ON tasks(completed_at, created_at, due_date)
+        WHERE status = 'completed'""",
+}
+
+# 允许通过 update_task 修改的字段白名单
+UPDATABLE_COLUMNS = ("title", "description", "status", "due_date", "priority")
+
+# 懒初始化标记：首次获取连接时才建表，导入模块不触碰数据库
+_db_initialized = False
+
+
+def _connect():
+    """创建原始数据库连接"""
+    conn = sqlite3.connect(DB_PATH, factory=connection_factory())
     conn.row_factory = sqlite3.Row  # 返回字典格式
     return conn
 
 
+def get_db_connection(with_archive: bool = False):
+    """
+    获取数据库连接（首次调用时自动初始化表结构）
+
+    with_archive=True 时挂载归档库（schema 名 archive），
+    并提供合并热表与归档表的临时视图 all_tasks
+    """
+    if not _db_initialized:
+        init_database()
+    conn = _connect()
+    if with_archive:
+        _attach_archive(conn)
+    return conn
+
+
+def _attach_archive(conn):
+    """挂载归档库并确保归档表、索引和 all_tasks 视图存在"""
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_PATH,))
+    conn.execute("PRAGMA archive.auto_vacuum = INCREMENTAL")  # 仅对新建的归档库生效
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive.tasks (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            status TEXT NOT NULL,
+            due_date DATE,
+            priority INTEGER,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+    ''')
+    _migrate_completed_at(conn, "archive")
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_created_at ON tasks(created_at, priority)')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS archive.idx_completed_at ON tasks(completed_at, created_at, due_date)
+        WHERE status = 'completed'
+    ''')
+    # 普通视图不能引用挂载库，因此使用连接级的临时视图
+    conn.execute(f'''
+        CREATE TEMP VIEW all_tasks AS
+        SELECT {TASK_COLUMNS} FROM main.tasks
+        UNION ALL
+        SELECT {TASK_COLUMNS} FROM archive.tasks
+    ''')
+
+
+def _migrate_completed_at(conn, schema: str):
+    """
+    旧库补充 completed_at 列：已完成任务用 updated_at 近似完成时间，
+    并删除按 updated_at 建的旧完成索引（随后按新定义重建）
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(tasks)")]
+    if "completed_at" in columns:
+        return
+    conn.execute(f"ALTER TABLE {schema}.tasks ADD COLUMN completed_at TIMESTAMP")
+    conn.execute(f"UPDATE {schema}.tasks SET completed_at = updated_at WHERE status = 'completed'")
+    conn.execute(f"DROP INDEX IF EXISTS {schema}.idx_completed_at")
+    conn.commit()
+
+
 def init_database():
     """初始化数据库表"""
-    conn = get_db_connection()
+    global _db_initialized
+
+    conn = _connect()
     cursor = conn.cursor()
 
+    # 新建的数据库使用增量 VACUUM，归档后可以分步回收空间（已有数据库不受影响）
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # WAL 模式：读事务不阻塞写入，在线备份可以固定一个快照逐步复制
+    cursor.execute("PRAGMA journal_mode = WAL")
+
     # 创建任务表
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS tasks (
@@ -29,39 +128,101 @@ def init_database():
             due_date DATE,
             priority INTEGER DEFAULT 3,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
         )
     ''')
+    _migrate_completed_at(conn, "main")
 
     # 创建索引
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_status ON tasks(status)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_due_date ON tasks(due_date)')
+    for ddl in TASK_INDEXES.values():
+        cursor.execute(ddl)
+
+    # 创建AI任务创建作业队列表（持久化，重启后继续处理）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            task_id INTEGER,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            lease_owner TEXT,
+            lease_expires_at TIMESTAMP
+        )
+    ''')
+    # 旧库补充作业租约列（running 作业只有租约过期后才会被其他进程接手）
+    ai_job_columns = {row[1] for row in cursor.execute("PRAGMA table_info(ai_jobs)")}
+    if "lease_owner" not in ai_job_columns:
+        cursor.execute("ALTER TABLE ai_jobs ADD COLUMN lease_owner TEXT")
+        cursor.execute("ALTER TABLE ai_jobs ADD COLUMN lease_expires_at TIMESTAMP")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ai_jobs_status ON ai_jobs(status)')
+
+    # 创建任务查重用的 LSH 桶表（桶键 -> 任务ID）
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_lsh'")
+    lsh_exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_lsh (
+            band_key INTEGER NOT NULL,
+            task_id INTEGER NOT NULL,
+            PRIMARY KEY (band_key, task_id)
+        ) WITHOUT ROWID
+    ''')
+    # 修改标题、删除和归档时按 task_id 删除全部桶键
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_task_lsh_task'")
+    if lsh_exists and not cursor.fetchone():
+        # 旧版本按当前标题删除桶键，清理已删除或已归档任务遗留的桶键
+        cursor.execute("DELETE FROM task_lsh WHERE task_id NOT IN (SELECT id FROM tasks)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_lsh_task ON task_lsh(task_id)")
+    if not lsh_exists:
+        # 已有数据库首次启用查重时，为现有任务补建索引
+        cursor.execute("SELECT id, title FROM tasks")
+        existing = cursor.fetchall()
+        if existing:
+            print(f"🔎 为 {len(existing)} 个已有任务建立查重索引...")
+            dedup.index_tasks(cursor, existing)
 
     conn.commit()
     conn.close()
+    _db_initialized = True
     print("✅ 数据库初始化完成")
 
 
-def get_all_tasks(status: Optional[str] = None) -> List[Dict[str, Any]]:
-    """获取所有任务"""
-    conn = get_db_connection()
+def get_all_tasks(status: Optional[str] = None, include_archived: bool = False) -> List[Dict[str, Any]]:
+    """获取所有任务（include_archived=True 时包含归档库中的任务）"""
+    conn = get_db_connection(with_archive=include_archived)
     cursor = conn.cursor()
+    source = "all_tasks" if include_archived else "tasks"
 
     if status:
         cursor.execute(
-            "SELECT * FROM tasks WHERE status = ? ORDER BY created_at DESC",
+            f"SELECT * FROM {source} WHERE status = ? ORDER BY created_at DESC",
             (status,)
         )
     else:
-        cursor.execute("SELECT * FROM tasks ORDER BY created_at DESC")
+        cursor.execute(f"SELECT * FROM {source} ORDER BY created_at DESC")
 
     tasks = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return tasks
 
 
-def get_task_by_id(task_id: int) -> Optional[Dict[str, Any]]:
-    """根据ID获取任务"""
+def get_task_by_id(task_id: int, include_archived: bool = False) -> Optional[Dict[str, Any]]:
+    """根据ID获取任务（热表经过进程内缓存，归档任务不进缓存）"""
+    task = task_cache.get(task_id, _load_task)
+    if task is None and include_archived:
+        conn = get_db_connection(with_archive=True)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {TASK_COLUMNS} FROM archive.tasks WHERE id = ?", (task_id,))
+        row = cursor.fetchone()
+        conn.close()
+        task = dict(row) if row else None
+    return task
+
+
+def _load_task(task_id: int) -> Optional[Dict[str, Any]]:
+    """从数据库读取单个任务"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
@@ -70,6 +231,25 @@ def get_task_by_id(task_id: int) -> Optional[Dict[str, Any]]:
     return dict(row) if row else None
 
 
+# 新建任务；直接以已完成状态创建时记录完成时间
+INSERT_TASK_SQL = '''
+    INSERT INTO tasks (title, description, status, due_date, priority, completed_at)
+    VALUES (?, ?, ?, ?, ?, CASE WHEN ? = 'completed' THEN CURRENT_TIMESTAMP END)
+'''
+
+
+def _insert_params(task_data: Dict[str, Any]) -> tuple:
+    status = task_data.get('status', 'pending')
+    return (
+        task_data['title'],
+        task_data.get('description', ''),
+        status,
+        task_data.get('due_date'),
+        task_data.get('priority', 3),
+        status
+    )
+
+
 def create_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
     """创建新任务"""
     print(f"🔧 开始创建任务: {task_data['title']}")
@@ -78,16 +258,8 @@ def create_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
     cursor = conn.cursor()
 
     print(f"📝 执行SQL插入...")
-    cursor.execute('''
-        INSERT INTO tasks (title, description, status, due_date, priority)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (
-        task_data['title'],
-        task_data.get('description', ''),
-        task_data.get('status', 'pending'),
-        task_data.get('due_date'),
-        task_data.get('priority', 3)
-    ))
+    cursor.execute(INSERT_TASK_SQL, _insert_params(task_data))
+    dedup.index_tasks(cursor, [{"id": cursor.lastrowid, "title": task_data['title']}])
 
     print(f"💾 提交事务...")
     conn.commit()
@@ -121,6 +293,7 @@ def create_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
 
     if row:
         result = dict(row)
+        task_cache.put(result)
         print(f"✅ 任务创建成功: ID={result['id']}, 标题={result['title']}")
         return result
     else:
@@ -128,86 +301,161 @@ def create_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
         raise Exception("任务创建后查询失败")
 
 
-def update_task(task_id: int, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    """更新任务"""
-    conn = get_db_connection()
+def create_tasks(tasks_data: List[Dict[str, Any]], conn: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+    """
+    批量创建任务（单个事务）
+
+    传入 conn 时在调用方的事务中执行，由调用方负责提交；
+    此时不写入缓存，避免调用方回滚后缓存中留下不存在的任务
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
     cursor = conn.cursor()
 
-    # 检查任务是否存在
-    cursor.execute("SELECT id FROM tasks WHERE id = ?", (task_id,))
-    if not cursor.fetchone():
-        conn.close()
-        return None
+    created = []
+    for task_data in tasks_data:
+        cursor.execute(INSERT_TASK_SQL + " RETURNING *", _insert_params(task_data))
+        created.append(dict(cursor.fetchone()))
+    dedup.index_tasks(cursor, created)
 
-    # 构建更新语句
-    set_clauses = []
-    values = []
+    if own_conn:
+        conn.commit()
+        conn.close()
+        for task in created:
+            task_cache.put(task)
+    return created
 
-    for key, value in update_data.items():
-        if value is not None:
-            set_clauses.append(f"{key} = ?")
-            values.append(value)
 
-    if not set_clauses:
-        conn.close()
+def update_task(task_id: int, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    更新任务
+
+    单条 UPDATE ... RETURNING 完成存在性检查、更新和回读；
+    字段名只允许来自 UPDATABLE_COLUMNS 白名单，不拼接外部输入
+    状态变为已完成时记录 completed_at，离开已完成状态时清空，其他修改不影响完成时间；
+    修改状态时需要先读出原完成时间（用于作废趋势缓存），读和写在同一个 BEGIN IMMEDIATE 事务中
+    """
+    unknown = [key for key in update_data if key not in UPDATABLE_COLUMNS]
+    if unknown:
+        raise ValueError(f"不支持更新的字段: {', '.join(unknown)}")
+
+    # 构建更新语句（按白名单顺序，值为 None 的字段跳过）
+    columns = [col for col in UPDATABLE_COLUMNS if update_data.get(col) is not None]
+    if not columns:
         return None
 
-    # 添加更新时间
+    set_clauses = [f"{col} = ?" for col in columns]
     set_clauses.append("updated_at = CURRENT_TIMESTAMP")
-
-    # 执行更新
+    values = [update_data[col] for col in columns]
+    if "status" in columns:
+        # SET 中引用的 status 是更新前的值
+        set_clauses.append(
+            "completed_at = CASE WHEN ? != 'completed' THEN NULL "
+            "WHEN status = 'completed' THEN completed_at ELSE CURRENT_TIMESTAMP END"
+        )
+        values.append(update_data["status"])
     values.append(task_id)
-    sql = f"UPDATE tasks SET {', '.join(set_clauses)} WHERE id = ?"
-    cursor.execute(sql, values)
-    conn.commit()
 
-    # 获取更新后的任务
-    updated_task = get_task_by_id(task_id)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    previous_completed_at = None
+    if "status" in columns:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT completed_at FROM tasks WHERE id = ?", (task_id,))
+        previous = cursor.fetchone()
+        previous_completed_at = previous["completed_at"] if previous else None
+    cursor.execute(
+        f"UPDATE tasks SET {', '.join(set_clauses)} WHERE id = ? RETURNING *",
+        values
+    )
+    row = cursor.fetchone()
+    if row and "title" in columns:
+        # 先删除旧标题的桶键，再按新标题写入
+        dedup.remove_tasks(cursor, [task_id])
+        dedup.index_tasks(cursor, [row])
+    conn.commit()
     conn.close()
+
+    if not row:
+        task_cache.invalidate(task_id)
+        return None
+
+    # 优先级影响创建日所在桶的平均优先级，状态影响原完成日所在桶的完成数，
+    # 截止日期影响完成日所在桶的逾期完成数
+    if "priority" in columns or "status" in columns or "due_date" in columns:
+        _invalidate_trends(row["created_at"], previous_completed_at, row["completed_at"])
+
+    # 写穿透：用 RETURNING 的结果直接刷新缓存
+    updated_task = dict(row)
+    task_cache.put(updated_task)
     return updated_task
 
 
+def _invalidate_trends(*timestamps: Optional[str]):
+    """修改或删除任务后，作废这些时间点所在的趋势缓存桶"""
+    # 延迟导入：analytics 依赖本模块
+    import analytics
+
+    analytics.invalidate_trend_days(ts[:10] for ts in timestamps if ts)
+
+
 def delete_task(task_id: int) -> bool:
     """删除任务"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-    deleted = cursor.rowcount > 0
+    cursor.execute("DELETE FROM tasks WHERE id = ? RETURNING id, created_at, completed_at", (task_id,))
+    removed = cursor.fetchall()
+    deleted = len(removed) > 0
+    dedup.remove_tasks(cursor, [row["id"] for row in removed])
 
     conn.commit()
     conn.close()
+    task_cache.invalidate(task_id)
+    for row in removed:
+        _invalidate_trends(row["created_at"], row["completed_at"])
     return deleted
 
 
-def get_task_stats() -> Dict[str, Any]:
-    """获取任务统计信息"""
+def find_similar_tasks(title: str, exclude_id: Optional[int] = None,
+                       include_completed: bool = True, limit: int = 10) -> List[Dict[str, Any]]:
+    """查找标题相似的任务（MinHash/LSH 候选 + Jaccard 确认），按相似度降序"""
     conn = get_db_connection()
+    similar = dedup.find_similar(conn, title, exclude_id, include_completed, limit)
+    conn.close()
+    return similar
+
+
+def get_task_stats(include_archived: bool = False) -> Dict[str, Any]:
+    """获取任务统计信息（include_archived=True 时包含归档库中的任务）"""
+    conn = get_db_connection(with_archive=include_archived)
     cursor = conn.cursor()
+    source = "all_tasks" if include_archived else "tasks"
 
-    cursor.execute("SELECT COUNT(*) as total FROM tasks")
+    cursor.execute(f"SELECT COUNT(*) as total FROM {source}")
     total = cursor.fetchone()['total']
 
-    cursor.execute("SELECT COUNT(*) as completed FROM tasks WHERE status = 'completed'")
+    cursor.execute(f"SELECT COUNT(*) as completed FROM {source} WHERE status = 'completed'")
     completed = cursor.fetchone()['completed']
 
-    cursor.execute("SELECT COUNT(*) as pending FROM tasks WHERE status = 'pending'")
+    cursor.execute(f"SELECT COUNT(*) as pending FROM {source} WHERE status = 'pending'")
     pending = cursor.fetchone()['pending']
 
-    cursor.execute("SELECT COUNT(*) as in_progress FROM tasks WHERE status = 'in_progress'")
+    cursor.execute(f"SELECT COUNT(*) as in_progress FROM {source} WHERE status = 'in_progress'")
     in_progress = cursor.fetchone()['in_progress']
 
-    cursor.execute("SELECT COUNT(*) as overdue FROM tasks WHERE due_date < DATE('now') AND status != 'completed'")
+    cursor.execute(f"SELECT COUNT(*) as overdue FROM {source} WHERE due_date < DATE('now') AND status != 'completed'")
     overdue = cursor.fetchone()['overdue']
 
     # 新增：优先级统计
-    cursor.execute("SELECT priority, COUNT(*) as count FROM tasks GROUP BY priority ORDER BY priority")
+    cursor.execute(f"SELECT priority, COUNT(*) as count FROM {source} GROUP BY priority ORDER BY priority")
     priority_stats = {}
     for row in cursor.fetchall():
         priority_stats[f"priority_{row['priority']}"] = row['count']
 
     # 新增：高优先级任务统计（优先级1-2）
-    cursor.execute("SELECT COUNT(*) as high_priority FROM tasks WHERE priority <= 2")
+    cursor.execute(f"SELECT COUNT(*) as high_priority FROM {source} WHERE priority <= 2")
     high_priority = cursor.fetchone()['high_priority']
 
     conn.close()
@@ -0,0 +1,186 @@
+"""
+性能剖析模块
+1. 慢操作日志：每个数据库连接从打开到关闭记为一次操作，
+   通过 sqlite3 的 trace 回调收集执行过的 SQL，progress 回调统计虚拟机指令数
+2. 单请求剖析：请求带 X-Profile 头或 ?profile=1 时用 cProfile 记录本次请求并保存结果
+"""
+
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# 慢操作阈值（毫秒），设为负数则关闭数据库追踪
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# 是否允许按请求开启 cProfile（默认关闭）
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+
+# progress 回调的触发间隔（虚拟机指令数）
+PROGRESS_STEPS = 10000
+
+# 每个操作保留的最后几条 SQL、最近慢操作和剖析结果数量
+MAX_STATEMENTS = 20
+MAX_SLOW_ENTRIES = 200
+MAX_PROFILES = 20
+
+# trace 回调拿到的是已代入参数的 SQL：记录前把字符串、BLOB 和数字字面量替换为 ?，
+# 避免任务标题、AI 输入文本等用户数据进入慢操作日志
+_SQL_LITERAL = re.compile(r"[xX]'[0-9a-fA-F]*'|'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b")
+
+
+def redact_sql(sql: str) -> str:
+    """去掉字面量并压缩空白，只保留语句模板"""
+    return " ".join(_SQL_LITERAL.sub("?", sql).split())
+
+
+class SlowQueryLog:
+    """按操作名汇总数据库耗时，并保留最近的慢操作明细"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS):
+        self.threshold_ms = threshold_ms
+        self.recent = deque(maxlen=MAX_SLOW_ENTRIES)
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, duration_ms: float, statements: Iterable[str], vm_steps: int):
+        with self._lock:
+            stats = self._stats.setdefault(
+                operation, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "slow_count": 0}
+            )
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            if duration_ms < self.threshold_ms:
+                return
+            stats["slow_count"] += 1
+
+        self.recent.append({
+            "operation": operation,
+            "duration_ms": round(duration_ms, 2),
+            "vm_steps": vm_steps,
+            "statements": [redact_sql(sql) for sql in statements],
+            "timestamp": datetime.now().isoformat()
+        })
+
+    def top_operations(self, limit: int = 20, order_by: str = "max_ms") -> List[Dict[str, Any]]:
+        """按最大耗时（或总耗时）排序的操作列表"""
+        with self._lock:
+            rows = [
+                {
+                    "operation": operation,
+                    "count": int(stats["count"]),
+                    "slow_count": int(stats["slow_count"]),
+                    "total_ms": round(stats["total_ms"], 2),
+                    "avg_ms": round(stats["total_ms"] / stats["count"], 2),
+                    "max_ms": round(stats["max_ms"], 2)
+                }
+                for operation, stats in self._stats.items()
+            ]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        return rows[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+            self.recent.clear()
+
+
+slow_query_log = SlowQueryLog()
+
+
+def _caller_name() -> str:
+    """找到打开连接的业务函数（跳过 database.py 内部的连接辅助函数）"""
+    frame = sys._getframe(2)
+    while frame and frame.f_code.co_name in ("_connect", "get_db_connection"):
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+
+class TracedConnection(sqlite3.Connection):
+    """记录 SQL 语句、指令数和连接存活耗时的连接，关闭时写入慢操作日志"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._operation = _caller_name()
+        self._statements = deque(maxlen=MAX_STATEMENTS)
+        self._vm_steps = 0
+        self._started = time.perf_counter()
+        self.set_trace_callback(self._statements.append)
+        self.set_progress_handler(self._on_progress, PROGRESS_STEPS)
+
+    def _on_progress(self) -> int:
+        self._vm_steps += PROGRESS_STEPS
+        return 0  # 返回非零会中断当前语句
+
+    def close(self):
+        super().close()
+        duration_ms = (time.perf_counter() - self._started) * 1000
+        slow_query_log.record(self._operation, duration_ms, self._statements, self._vm_steps)
+
+
+def connection_factory():
+    """sqlite3.connect 使用的连接类（关闭追踪时为普通连接）"""
+    return TracedConnection if slow_query_log.threshold_ms >= 0 else sqlite3.Connection
+
+
+class RequestProfiler:
+    """单请求 cProfile 剖析结果的存储"""
+
+    def __init__(self):
+        self.profiles = deque(maxlen=MAX_PROFILES)
+        self._ids = itertools.count(1)
+        self._active = False  # 同一时间只剖析一个请求
+
+    def wants_profile(self, headers, query_params) -> bool:
+        if not PROFILING_ENABLED or self._active:
+            return False
+        return headers.get("x-profile") in ("1", "true") or query_params.get("profile") in ("1", "true")
+
+    async def run(self, method: str, path: str, call_next, request):
+        """在 cProfile 下处理请求；同一事件循环中并发的其他请求也会被计入"""
+        profiler = cProfile.Profile()
+        self._active = True
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = await call_next(request)
+        finally:
+            profiler.disable()
+            self._active = False
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(40)
+
+        profile_id = next(self._ids)
+        self.profiles.append({
+            "id": profile_id,
+            "method": method,
+            "path": path,
+            "duration_ms": round(duration_ms, 2),
+            "timestamp": datetime.now().isoformat(),
+            "stats": output.getvalue()
+        })
+        response.headers["X-Profile-Id"] = str(profile_id)
+        return response
+
+    def get(self, profile_id: int) -> Optional[Dict[str, Any]]:
+        for profile in self.profiles:
+            if profile["id"] == profile_id:
+                return profile
+        return None
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,131 @@
+"""
+AI接口准入控制模块
+1. 令牌桶限流：每个客户端一个桶，另有一个全局桶
+2. 并发上限：同时处理的AI请求超过上限时直接拒绝，避免排队导致延迟失控
+3. 请求合并（single-flight）：并发的相同文本共享同一次解析
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+# 每个客户端的速率（请求/秒）和突发容量
+CLIENT_RATE = float(os.getenv("AI_RATE_PER_CLIENT", "5"))
+CLIENT_BURST = float(os.getenv("AI_BURST_PER_CLIENT", "10"))
+
+# 全局速率和突发容量
+GLOBAL_RATE = float(os.getenv("AI_RATE_GLOBAL", "50"))
+GLOBAL_BURST = float(os.getenv("AI_BURST_GLOBAL", "100"))
+
+# 同时处理的AI请求上限
+MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "16"))
+
+# 记录令牌桶的客户端数量上限（LRU 淘汰）
+MAX_CLIENTS = 10000
+
+
+class TokenBucket:
+    """令牌桶：按 rate 匀速补充，最多积累 capacity 个令牌"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self) -> float:
+        """还需等待多少秒才有一个令牌（0 表示现在就有）"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """客户端 + 全局两级令牌桶限流"""
+
+    def __init__(self, client_rate: float = CLIENT_RATE, client_burst: float = CLIENT_BURST,
+                 global_rate: float = GLOBAL_RATE, global_burst: float = GLOBAL_BURST):
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._clients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, client: str) -> float:
+        """尝试为客户端取一个令牌；成功返回 0，被限流时返回建议的重试等待秒数"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._clients.get(client)
+            if bucket is None:
+                bucket = TokenBucket(self.client_rate, self.client_burst)
+                self._clients[client] = bucket
+                if len(self._clients) > MAX_CLIENTS:
+                    self._clients.popitem(last=False)
+            self._clients.move_to_end(client)
+
+            bucket.refill(now)
+            self.global_bucket.refill(now)
+
+            # 两个桶都有令牌时才同时扣减，避免被全局限流的请求白白消耗客户端额度
+            wait = max(bucket.retry_after(), self.global_bucket.retry_after())
+            if wait > 0:
+                return wait
+            bucket.tokens -= 1
+            self.global_bucket.tokens -= 1
+            return 0.0
+
+
+class ConcurrencyLimiter:
+    """非阻塞并发上限：超过上限立即失败，而不是排队等待"""
+
+    def __init__(self, limit: int = MAX_CONCURRENCY):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+class SingleFlight:
+    """相同 key 的并发调用只执行一次，其余调用等待并共享结果"""
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.calls = 0  # 实际执行次数
+        self.shared = 0  # 共享结果的次数
+
+    def pending(self, key: str) -> bool:
+        """该 key 是否已有正在执行的调用"""
+        return key in self._in_flight
+
+    async def run(self, key: str, fn: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        在线程中执行 fn(key)，返回结果的浅拷贝（调用方可以各自修改）
+        执行放在独立任务中，发起者被取消（客户端断开）不会影响其他等待者
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(asyncio.to_thread(fn, key))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.shared += 1
+        return dict(await asyncio.shield(task))
@@ -0,0 +1,153 @@
+"""
+解析规则引擎
+日期、优先级、状态和重要性的关键词规则放在 JSON 文件中（默认 rules/default.json），
+加载一次并编译成匹配结构；文件变化后重新编译、整体替换，
+正在处理的请求继续使用它开始时拿到的那一版规则
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# 规则文件路径
+RULES_PATH = os.getenv(
+    "PARSER_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules", "default.json")
+)
+
+# 检查规则文件是否变化的最小间隔（秒），设为负数则不自动重载
+RULES_CHECK_INTERVAL = float(os.getenv("PARSER_RULES_CHECK_SECONDS", "1"))
+
+
+class KeywordMatcher:
+    """
+    有序关键词表：返回按规则顺序第一个出现在文本中的关键词对应的值
+    所有关键词预先合并成一个正则，文本不含任何关键词时一次搜索即可返回
+    """
+
+    __slots__ = ("entries", "_any")
+
+    def __init__(self, entries: Sequence[Tuple[str, Any]]):
+        self.entries = tuple((str(keyword), value) for keyword, value in entries)
+        # 较长的关键词放前面，只影响正则内部的尝试顺序，不影响结果
+        keywords = sorted({keyword for keyword, _ in self.entries}, key=len, reverse=True)
+        self._any = re.compile("|".join(map(re.escape, keywords))) if keywords else None
+
+    @classmethod
+    def from_keywords(cls, keywords: Sequence[str]) -> "KeywordMatcher":
+        return cls([(keyword, True) for keyword in keywords])
+
+    def any(self, text: str) -> bool:
+        return self._any is not None and self._any.search(text) is not None
+
+    def first(self, text: str, default: Any = None) -> Any:
+        if not self.any(text):
+            return default
+        for keyword, value in self.entries:
+            if keyword in text:
+                return value
+        return default
+
+
+class CompiledRules:
+    """一个版本的编译后规则（创建后不再修改，可被多个线程同时读取）"""
+
+    def __init__(self, data: Dict[str, Any], version: str):
+        self.version = version
+        try:
+            self.due_dates = KeywordMatcher([(k, int(days)) for k, days in data["date_keywords"]])
+            self.time_pattern = re.compile(data["time_pattern"])
+            self.priorities = KeywordMatcher([(k, int(p)) for k, p in data["priority_keywords"]])
+            self.statuses = KeywordMatcher(data["status_keywords"])
+
+            self.urgent = KeywordMatcher.from_keywords(data["urgent_keywords"])
+            self.important = KeywordMatcher.from_keywords(data["important_keywords"])
+            self.low_priority = KeywordMatcher.from_keywords(data["low_priority_keywords"])
+
+            reasons = data["reason_keywords"]
+            self.reason_urgent = KeywordMatcher.from_keywords(reasons["urgent"])
+            self.reason_important = KeywordMatcher.from_keywords(reasons["important"])
+            self.reason_low = KeywordMatcher.from_keywords(reasons["low"])
+
+            # 命中默认级别的关键词等同于没有命中，只编译其他级别
+            self.default_importance = data["default_importance"]
+            self.importance = KeywordMatcher([
+                (keyword, level)
+                for level, keywords in data["importance_keywords"]
+                if level != self.default_importance
+                for keyword in keywords
+            ])
+        except (KeyError, TypeError, ValueError, re.error) as e:
+            raise ValueError(f"规则格式错误: {e!r}") from e
+
+
+def load_rules(path: str) -> CompiledRules:
+    """读取并编译规则文件；版本号由文件中的 version 和内容哈希组成，内容变化版本号必然变化"""
+    with open(path, "rb") as f:
+        content = f.read()
+    try:
+        data = json.loads(content)
+    except ValueError as e:
+        raise ValueError(f"规则文件不是有效的 JSON: {e}") from e
+    version = f"{data.get('version', 0)}-{hashlib.sha256(content).hexdigest()[:8]}"
+    return CompiledRules(data, version)
+
+
+class RuleEngine:
+    """持有当前规则，访问时按间隔检查文件变化并热重载（加载失败时保留旧规则）"""
+
+    def __init__(self, path: str = RULES_PATH, check_interval: float = RULES_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._file_state = self._stat()
+        self._rules = load_rules(path)
+        self._next_check = time.monotonic() + check_interval
+
+    @property
+    def current(self) -> CompiledRules:
+        """当前规则；调用方应在一次解析中只取一次，保证整个解析使用同一版本"""
+        if self.check_interval >= 0 and time.monotonic() >= self._next_check:
+            self._check_reload()
+        return self._rules
+
+    @property
+    def version(self) -> str:
+        return self.current.version
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _check_reload(self):
+        # 其他线程正在检查或重载时直接使用当前规则，不等待
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            file_state = self._stat()
+            if file_state is None or file_state == self._file_state:
+                return
+            self._file_state = file_state
+            self.reload()
+        finally:
+            self._lock.release()
+
+    def reload(self) -> bool:
+        """重新加载规则文件，成功后整体替换当前规则"""
+        try:
+            rules = load_rules(self.path)
+        except (OSError, ValueError) as e:
+            print(f"❌ 解析规则加载失败，继续使用版本 {self._rules.version}: {e}")
+            return False
+        if rules.version != self._rules.version:
+            self._rules = rules
+            print(f"🔄 解析规则已更新: 版本 {rules.version}")
+        return True
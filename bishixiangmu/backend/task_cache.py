@@ -0,0 +1,134 @@
+"""
+任务读缓存模块
+进程内 LRU 读穿透缓存，使用 __slots__ 紧凑记录代替 dict 保存任务
+写操作（创建/更新/删除）由 database.py 写穿透维护
+
+缓存只感知本进程内的写入：多进程部署（uvicorn --workers N）时，其他进程的修改
+最长要等 TASK_CACHE_TTL_SECONDS 才可见；需要强一致时设置 TASK_CACHE_SIZE=0 关闭缓存
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# 缓存容量（任务条数），设为 0 则关闭缓存
+CACHE_SIZE = int(os.getenv("TASK_CACHE_SIZE", "2048"))
+
+# 缓存记录的有效期（秒），设为 0 则不过期（仅适合单进程部署）
+CACHE_TTL = float(os.getenv("TASK_CACHE_TTL_SECONDS", "30"))
+
+
+class TaskRecord:
+    """紧凑任务记录：固定字段，无实例 __dict__"""
+
+    __slots__ = ("id", "title", "description", "status", "due_date",
+                 "priority", "created_at", "updated_at", "completed_at")
+
+    def __init__(self, id, title, description, status, due_date,
+                 priority, created_at, updated_at, completed_at=None):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.status = status
+        self.due_date = due_date
+        self.priority = priority
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.completed_at = completed_at
+
+    @classmethod
+    def from_row(cls, row) -> "TaskRecord":
+        """从 sqlite3.Row 或 dict 构造"""
+        return cls(*(row[field] for field in cls.__slots__))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为普通字典（每次返回新对象，调用方可以随意修改）"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class TaskCache:
+    """
+    有界 LRU 任务缓存，记录命中率
+    每次写入、作废或清空都会递增代数；读穿透在锁外加载数据，
+    加载期间代数变化（可能有并发的更新、归档或恢复）时不缓存加载结果，避免写回旧数据
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # 任务ID -> (记录, 过期时刻)
+        self._records: "OrderedDict[int, Tuple[TaskRecord, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, task_id: int, loader: Callable[[int], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """读穿透：命中直接返回，未命中调用 loader 从数据库读取并缓存"""
+        with self._lock:
+            entry = self._records.get(task_id)
+            if entry is not None:
+                record, expires = entry
+                if expires >= time.monotonic():
+                    self._records.move_to_end(task_id)
+                    self.hits += 1
+                    return record.to_dict()
+                del self._records[task_id]
+            self.misses += 1
+            generation = self._generation
+
+        task = loader(task_id)
+        if task is not None:
+            self._store(task, generation)
+        return task
+
+    def put(self, task: Dict[str, Any]):
+        """写入/替换一条任务记录"""
+        self._store(task, None)
+
+    def _store(self, task: Dict[str, Any], generation: Optional[int]):
+        """generation 不为空时，仅在代数未变化的情况下写入"""
+        if self.max_size <= 0:
+            return
+        record = TaskRecord.from_row(task)
+        expires = time.monotonic() + self.ttl if self.ttl > 0 else float("inf")
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._generation += 1
+            self._records[record.id] = (record, expires)
+            self._records.move_to_end(record.id)
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+
+    def invalidate(self, task_id: int):
+        """移除一条任务记录"""
+        with self._lock:
+            self._generation += 1
+            self._records.pop(task_id, None)
+
+    def clear(self):
+        """清空缓存和计数"""
+        with self._lock:
+            self._generation += 1
+            self._records.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存状态（命中率仪表）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._records),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# 全局缓存实例
+task_cache = TaskCache()
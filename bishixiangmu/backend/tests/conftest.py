@@ -0,0 +1,32 @@
+"""
+pytest 公共夹具
+测试从 backend 目录或仓库根目录运行均可：python -m pytest backend/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def database():
+    """指向临时数据库的 database 模块（结束后恢复原路径并清空任务缓存）"""
+    from benchmark import _temp_database
+
+    with _temp_database() as database:
+        yield database
+
+
+@pytest.fixture
+def backup_dir(tmp_path, monkeypatch):
+    """备份目录改到临时目录"""
+    import backup
+
+    path = tmp_path / "backups"
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(path))
+    return path
@@ -0,0 +1,101 @@
+"""快照备份：整库恢复往返一致，导入失败时回滚并保留索引，已归档任务不会被导回"""
+
+import pytest
+
+import backup
+import dedup
+from archive import archive_completed_tasks
+from database import TASK_COLUMNS, TASK_INDEXES
+
+
+def _rows(database, table="tasks"):
+    conn = database.get_db_connection(with_archive=table.startswith("archive."))
+    rows = [tuple(row) for row in conn.execute(f"SELECT {TASK_COLUMNS} FROM {table} ORDER BY id")]
+    conn.close()
+    return rows
+
+
+def _indexes(database):
+    conn = database.get_db_connection()
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+    return names
+
+
+def _complete_long_ago(database, task_id):
+    conn = database.get_db_connection()
+    conn.execute("UPDATE tasks SET status = 'completed', completed_at = datetime('now', '-90 days') WHERE id = ?",
+                 (task_id,))
+    conn.commit()
+    conn.close()
+
+
+def _create(database, count):
+    return [database.create_task({"title": f"备份测试任务{i}", "description": f"描述{i}", "priority": 3})["id"]
+            for i in range(count)]
+
+
+def test_restore_round_trip(database, backup_dir):
+    ids = _create(database, 20)
+    expected = _rows(database)
+    snapshot = backup.create_snapshot()
+
+    database.update_task(ids[0], {"title": "快照之后修改"})
+    database.delete_task(ids[1])
+    _create(database, 3)
+
+    backup.restore_snapshot(snapshot["id"])
+    assert _rows(database) == expected
+    assert database.get_task_by_id(ids[0])["title"] == "备份测试任务0"
+
+
+def test_failed_import_rolls_back_and_keeps_indexes(database, backup_dir, monkeypatch):
+    ids = _create(database, 20)
+    snapshot = backup.create_snapshot()
+    for task_id in ids[:10]:
+        database.delete_task(task_id)
+    before = _rows(database)
+
+    def fail(cursor, tasks):
+        raise RuntimeError("模拟写索引失败")
+
+    monkeypatch.setattr(dedup, "index_tasks", fail)
+    for defer in (False, True):
+        with pytest.raises(RuntimeError):
+            backup.import_snapshot_tasks(snapshot["id"], defer_indexes=defer)
+        assert _rows(database) == before
+        assert set(TASK_INDEXES) <= _indexes(database)
+
+
+def test_import_indexes_only_inserted_tasks(database, backup_dir):
+    ids = _create(database, 20)
+    snapshot = backup.create_snapshot()
+    for task_id in ids[:5]:
+        database.delete_task(task_id)
+
+    result = backup.import_snapshot_tasks(snapshot["id"])
+    assert result["imported"] == 5
+
+    conn = database.get_db_connection()
+    indexed = {row[0] for row in conn.execute("SELECT DISTINCT task_id FROM task_lsh")}
+    orphans = conn.execute("SELECT COUNT(*) FROM task_lsh WHERE task_id NOT IN (SELECT id FROM tasks)").fetchone()[0]
+    conn.close()
+    assert indexed == set(ids)
+    assert orphans == 0
+    assert ids[0] in [task["id"] for task in database.find_similar_tasks("备份测试任务0")]
+
+
+def test_archived_tasks_are_not_resurrected(database, backup_dir):
+    ids = _create(database, 10)
+    snapshot = backup.create_snapshot()  # 快照时还没有归档库
+    for task_id in ids[:4]:
+        _complete_long_ago(database, task_id)
+    assert archive_completed_tasks(older_than_days=30) == 4
+
+    backup.import_snapshot_tasks(snapshot["id"])
+    assert [row[0] for row in _rows(database)] == ids[4:]
+
+    # 快照中没有归档库：恢复后归档表被清空，任务只存在于热库
+    backup.restore_snapshot(snapshot["id"])
+    assert [row[0] for row in _rows(database)] == ids
+    assert _rows(database, "archive.tasks") == []
@@ -0,0 +1,54 @@
+"""任务缓存：写穿透保持新鲜，并发写入期间加载的旧数据不写回，记录按 TTL 过期"""
+
+import time
+
+from benchmark import _seed_tasks
+from task_cache import TaskCache
+
+
+def _row(task_id, title="任务"):
+    return {
+        "id": task_id, "title": title, "description": None, "status": "pending", "due_date": None,
+        "priority": 3, "created_at": "2026-01-01 00:00:00", "updated_at": "2026-01-01 00:00:00",
+        "completed_at": None
+    }
+
+
+def test_write_through_keeps_cache_fresh(database):
+    first, second = _seed_tasks(database, 2)
+    database.get_task_by_id(first)
+    database.get_task_by_id(second)
+
+    database.update_task(first, {"priority": 5})
+    assert database.get_task_by_id(first)["priority"] == 5
+    database.delete_task(second)
+    assert database.get_task_by_id(second) is None
+
+
+def test_load_racing_with_invalidate_is_not_cached():
+    cache = TaskCache(max_size=10, ttl=0)
+
+    def loader(task_id):
+        cache.invalidate(task_id)  # 加载期间有并发的更新、归档或恢复
+        return _row(task_id, "旧数据")
+
+    assert cache.get(1, loader)["title"] == "旧数据"
+    assert cache.stats()["size"] == 0
+    assert cache.get(1, lambda task_id: _row(task_id, "新数据"))["title"] == "新数据"
+    assert cache.stats()["size"] == 1
+
+
+def test_records_expire_after_ttl():
+    cache = TaskCache(max_size=10, ttl=0.05)
+    cache.put(_row(1, "旧数据"))
+    assert cache.get(1, lambda task_id: None)["title"] == "旧数据"
+    time.sleep(0.1)
+    assert cache.get(1, lambda task_id: _row(task_id, "新数据"))["title"] == "新数据"
+
+
+def test_lru_evicts_oldest():
+    cache = TaskCache(max_size=2, ttl=0)
+    for task_id in (1, 2, 3):
+        cache.put(_row(task_id))
+    assert cache.get(1, lambda task_id: None) is None
+    assert cache.stats()["size"] == 2
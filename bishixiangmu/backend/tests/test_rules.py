@@ -0,0 +1,72 @@
+"""解析规则：编译规则与旧实现结果一致，规则文件修改后热重载，格式错误时保留旧规则"""
+
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+
+import pytest
+
+from ai_parser import AITaskParser
+from benchmark import _legacy_importance, _legacy_rule_parse
+from rule_engine import RULES_PATH, RuleEngine
+
+FRAGMENTS = ["明天", "下周", "大后天", "下午3点", "紧急", "重要", "有空", "正在", "完成了", "会议", "汇报",
+             "整理", "文档", "客户", "需求", "评审", "项目", "进度", "报告", "预算", "DEADLINE", "一般"]
+
+
+@pytest.fixture
+def rules_path(tmp_path):
+    path = tmp_path / "rules.json"
+    shutil.copy(RULES_PATH, path)
+    return str(path)
+
+
+@pytest.fixture
+def parser(rules_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return AITaskParser(RuleEngine(rules_path, check_interval=0))
+
+
+def _write_rules(path, data):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def test_compiled_rules_match_legacy_parser(parser):
+    rng = random.Random(3)
+    texts = ["".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(2, 8))) for _ in range(2000)]
+    for text in texts:
+        task = _legacy_rule_parse(text)
+        assert parser._parse_with_rules(text) == task, text
+        assert parser.analyze_task_importance(task)["importance"] == _legacy_importance(task), text
+
+
+def test_rule_file_change_is_reloaded(parser, rules_path):
+    engine = parser.rules
+    old_version = engine.version
+    assert parser._parse_with_rules("整理文档")["priority"] != 1
+
+    with open(rules_path, encoding="utf-8") as f:
+        data = json.load(f)
+    data["urgent_keywords"].append("整理")
+    _write_rules(rules_path, data)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert engine.reload()
+
+    assert engine.version != old_version
+    assert parser._parse_with_rules("整理文档")["priority"] == 1
+
+
+def test_invalid_rule_file_keeps_current_rules(parser, rules_path):
+    engine = parser.rules
+    old_version = engine.version
+    with open(rules_path, "w", encoding="utf-8") as f:
+        f.write("{不是 JSON")
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert not engine.reload()
+    assert engine.version == old_version
+    assert parser._parse_with_rules("紧急修复")["priority"] == 1
@@ -0,0 +1,33 @@
+"""启动：import app 的耗时预算（python -X importtime），以及初始化推迟到 lifespan"""
+
+from fastapi.testclient import TestClient
+
+from benchmark import DEFERRED_MODULES, PROJECT_IMPORT_BUDGET_MS, STARTUP_BUDGET_MS, measure_import_app
+
+
+def test_import_app_within_budget():
+    result = measure_import_app(runs=5)
+    assert result["returncode"] == 0, result["stderr"]
+
+    total_ms = result["timings"]["app"] / 1000
+    project_ms = result["project_us"] / 1000
+    assert project_ms <= PROJECT_IMPORT_BUDGET_MS, (
+        f"本项目模块导入耗时 {project_ms:.1f} ms，预算 {PROJECT_IMPORT_BUDGET_MS} ms"
+    )
+    assert total_ms <= STARTUP_BUDGET_MS, f"import app 耗时 {total_ms:.0f} ms，预算 {STARTUP_BUDGET_MS} ms"
+
+
+def test_import_app_has_no_side_effects():
+    result = measure_import_app()
+    assert result["returncode"] == 0, result["stderr"]
+    assert not result["db_created"], "导入 app 时不应创建数据库"
+    assert result["stdout"] == "", "导入 app 时不应产生输出"
+    assert not [module for module in DEFERRED_MODULES if module in result["timings"]]
+
+
+def test_ready_after_lifespan(database):
+    import app
+
+    with TestClient(app.app) as client:
+        assert client.get("/ready").status_code == 200
+        assert client.get("/health").status_code == 200
@@ -0,0 +1,46 @@
+"""任务更新：UPDATE ... RETURNING、完成时间，以及窗口内连续修改的写合并"""
+
+import asyncio
+
+import pytest
+
+from benchmark import _seed_tasks
+from write_coalescer import UpdateCoalescer
+
+
+def test_update_returns_updated_row(database):
+    task_id = _seed_tasks(database, 1)[0]
+    updated = database.update_task(task_id, {"priority": 1, "title": "新标题"})
+    assert updated["priority"] == 1
+    assert updated["title"] == "新标题"
+    assert database.update_task(10 ** 9, {"priority": 1}) is None
+    with pytest.raises(ValueError):
+        database.update_task(task_id, {"id": 5})
+
+
+def test_completed_at_follows_status(database):
+    task_id = _seed_tasks(database, 1)[0]
+    completed = database.update_task(task_id, {"status": "completed"})
+    assert completed["completed_at"] is not None
+    # 其他修改和重复设为已完成都不改变完成时间
+    assert database.update_task(task_id, {"priority": 2})["completed_at"] == completed["completed_at"]
+    assert database.update_task(task_id, {"status": "completed"})["completed_at"] == completed["completed_at"]
+    assert database.update_task(task_id, {"status": "pending"})["completed_at"] is None
+
+
+def test_coalescer_merges_burst_into_one_write(database):
+    task_id = _seed_tasks(database, 1)[0]
+
+    async def burst():
+        coalescer = UpdateCoalescer(writer=database.update_task, debounce_ms=30)
+        results = await asyncio.gather(*[
+            coalescer.update(task_id, {"priority": i % 5 + 1}) for i in range(20)
+        ])
+        return coalescer, results
+
+    coalescer, results = asyncio.run(burst())
+    assert coalescer.requests == 20
+    assert coalescer.writes == 1
+    final = database.get_task_by_id(task_id)
+    assert final["priority"] == 5  # 窗口内最后一次修改生效
+    assert all(result == final for result in results)
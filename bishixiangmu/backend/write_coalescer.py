@@ -0,0 +1,59 @@
+"""
+任务写合并模块
+短时间窗口内对同一任务的多次更新（拖拽调整优先级、频繁切换状态）合并为一次写入
+"""
+
+import asyncio
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from database import update_task
+
+# 合并窗口（毫秒），设为 0 则每次更新直接写库
+DEBOUNCE_MS = int(os.getenv("TASK_UPDATE_DEBOUNCE_MS", "30"))
+
+
+class UpdateCoalescer:
+    """按任务ID合并更新：窗口内后到的字段覆盖先到的字段，所有调用方共享同一个写入结果"""
+
+    def __init__(self, writer: Callable[[int, Dict[str, Any]], Optional[Dict[str, Any]]] = update_task,
+                 debounce_ms: int = DEBOUNCE_MS):
+        self.writer = writer
+        self.debounce = debounce_ms / 1000
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self.writes = 0  # 实际写库次数
+        self.requests = 0  # 收到的更新请求次数
+
+    async def update(self, task_id: int, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """提交一次更新，返回合并写入后的任务（任务不存在时为 None）"""
+        self.requests += 1
+        if self.debounce <= 0:
+            self.writes += 1
+            return self.writer(task_id, update_data)
+
+        future = asyncio.get_running_loop().create_future()
+        if task_id in self._pending:
+            self._pending[task_id].update(update_data)
+            self._waiters[task_id].append(future)
+        else:
+            self._pending[task_id] = dict(update_data)
+            self._waiters[task_id] = [future]
+            asyncio.get_running_loop().call_later(self.debounce, self._flush, task_id)
+        return await future
+
+    def _flush(self, task_id: int):
+        """窗口结束：执行一次写入并唤醒所有等待者"""
+        update_data = self._pending.pop(task_id)
+        waiters = self._waiters.pop(task_id)
+        self.writes += 1
+        try:
+            result = self.writer(task_id, update_data)
+        except Exception as e:
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in waiters:
+            if not future.done():
+                future.set_result(result)